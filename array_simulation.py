@@ -0,0 +1,354 @@
+from collections import deque
+import numpy as np
+
+from constants import CAR_SPEED, CIRCLE_RAD, OPTIMAL_DISTANCE, TRAFFIC_LIGHT_WIDTH
+
+HEADWAY = 2 * CIRCLE_RAD + OPTIMAL_DISTANCE  # a car stops when the car in front of it is nearer, see Car.move
+STOP_DISTANCE = CIRCLE_RAD + TRAFFIC_LIGHT_WIDTH // 2 + OPTIMAL_DISTANCE  # and this near to a red light
+
+
+class CarArrays:
+    # structure of arrays holding every car that has left its spawn queue, one row per car
+    FIELDS = (('id', np.int64), ('x', np.float64), ('y', np.float64), ('speed', np.float64),
+              ('distToCrossroad', np.float64), ('distToSpawnpoint', np.float64), ('waitingTime', np.float64),
+              ('passed', np.bool_), ('line', np.int64), ('destinationLine', np.int64))
+
+    def __init__(self):
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(0, dtype))
+
+    def __len__(self):
+        return len(self.id)
+
+    def extend(self, rows):
+        # rows are dicts with a value for every field
+        for name, dtype in self.FIELDS:
+            column = np.array([row[name] for row in rows], dtype)
+            setattr(self, name, np.concatenate((getattr(self, name), column)))
+
+    def keep(self, mask):
+        for name, dtype in self.FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+
+class ArrayTraffic:
+    # the spawned cars of one or more ArrayCrossroads in a single CarArrays, so a CrossroadBatch moves the cars
+    # of all its crossroads in one vectorised pass. Lines are numbered across the crossroads, and what Car.move
+    # looks up about a line is kept in tables indexed by that number. Cars follow the rules of Car.move in the
+    # order Crossroad.moveCars sweeps them, so every car sees where the car in front of it got to in the same tick.
+    # A tick costs a few dozen NumPy calls however many cars there are: slower than Crossroad for a lone crossroad,
+    # about as fast for five crossroads of moderate traffic and faster from there on
+    def __init__(self, crossroads):
+        self.crossroads = crossroads
+        self.physicsTicks = crossroads[0].physicsTicks
+        self.cars = CarArrays()
+        self.lines = []
+        line_crossroads = []
+        line_roads = []
+        for k, crossroad in enumerate(crossroads):
+            if crossroad.carsOnRoads or crossroad.processedCars:
+                raise ValueError("Crossroads can only share their traffic before any car has arrived")
+            crossroad.traffic = self
+            crossroad.trafficIndex = k
+            start = len(self.lines)
+            for road in crossroad.roads:
+                for line in road.lines:
+                    self.lines.append(line)
+                    line_crossroads.append(k)
+                    line_roads.append(road.number)
+            crossroad.trafficLines = slice(start, len(self.lines))
+        self.lineIndex = {line: i for i, line in enumerate(self.lines)}
+
+        lines = self.lines
+        self.lineCrossroad = np.array(line_crossroads, np.int64)
+        self.lineRoad = np.array(line_roads, np.int64)
+        self.lineVertical = np.array([line.vertical for line in lines], np.bool_)
+        self.lineSign = np.array([line.sign for line in lines], np.float64)
+        self.lineCoordinate = np.array([line.coordinate for line in lines], np.float64)
+        self.lineCrossroadStart = np.array([line.crossroadStart for line in lines], np.float64)
+        self.lineCrossroadEnd = np.array([line.crossroadEnd for line in lines], np.float64)
+        # cars beyond these leave the screen, see Car.isOffScreen
+        self.lineScreenRight = np.array([crossroads[k].screenSize[0] + 3 * CIRCLE_RAD for k in line_crossroads])
+        self.lineScreenBottom = np.array([crossroads[k].screenSize[1] + 3 * CIRCLE_RAD for k in line_crossroads])
+        self.lineLightColor = np.array([line.trafficLightColor for line in lines], np.int64)
+        self.lineActive = np.ones(len(lines), np.bool_)  # lines of the crossroads still being stepped
+
+        # the cars of a queue all wait together, so their waiting is kept per line as the number of spawn steps
+        # the queue has been blocked for
+        self.queueLength = np.zeros(len(lines), np.int64)
+        self.queueBlockedSteps = np.zeros(len(lines), np.int64)
+        self.queueEnqueuedAt = [deque() for line in lines]  # queueBlockedSteps when each queued car arrived
+        self.queueWaits = [0]  # waitingTime after n blocked steps, added up step by step like Car.wait does
+        self.updateApproaches()
+
+    def setActive(self, crossroads):
+        # the cars of the other crossroads are dropped, their statistics stay as they are
+        active = np.zeros(len(self.crossroads), np.bool_)
+        active[[crossroad.trafficIndex for crossroad in crossroads]] = True
+        self.lineActive = active[self.lineCrossroad]
+        self.cars.keep(self.lineActive[self.cars.line])
+        self.updateApproaches()
+
+    def setLights(self, crossroad):
+        lines = crossroad.trafficLines
+        self.lineLightColor[lines] = [line.trafficLightColor for line in self.lines[lines]]
+
+    def enqueue(self, line):
+        i = self.lineIndex[line]
+        self.queueLength[i] += 1
+        self.queueEnqueuedAt[i].append(self.queueBlockedSteps[i])
+
+    def getQueueWait(self, blocked_steps):
+        waits = self.queueWaits
+        while len(waits) <= blocked_steps:
+            waits.append(waits[-1] + self.physicsTicks / 60)
+        return waits[blocked_steps]
+
+    def getCarCount(self, crossroad):
+        if len(self.crossroads) == 1:
+            return len(self.cars)
+        return int(np.count_nonzero(self.lineCrossroad[self.cars.line] == crossroad.trafficIndex))
+
+    def spawnCars(self):
+        # Line.spawnCar for every line at once
+        cars = self.cars
+        ticks = self.physicsTicks
+        approaching = ~cars.passed
+        # the last approaching car of a line is the one nearest to the spawn point
+        nearest = np.full(len(self.lines), np.inf)
+        np.minimum.at(nearest, cars.line[approaching], cars.distToSpawnpoint[approaching])
+        queued = (self.queueLength > 0) & self.lineActive
+        blocked = queued & (nearest < HEADWAY)
+        if blocked.any():
+            self.queueBlockedSteps[blocked] += 1
+            waiting = np.bincount(self.lineCrossroad[blocked], self.queueLength[blocked], len(self.crossroads))
+            for k in np.flatnonzero(waiting).tolist():
+                self.crossroads[k].waitingCars += int(waiting[k]) * ticks
+
+        rows = []
+        for i in np.flatnonzero(queued & ~blocked).tolist():
+            line = self.lines[i]
+            crossroad = self.crossroads[self.lineCrossroad[i]]
+            car = line.queue.popleft()
+            self.queueLength[i] -= 1
+            car.waitingTime = self.getQueueWait(int(self.queueBlockedSteps[i] - self.queueEnqueuedAt[i].popleft()))
+            if car.waitingTime > crossroad.maxWaitingTime:
+                crossroad.maxWaitingTime = car.waitingTime
+            x, y = line.spawnPoint
+            rows.append({'id': car.id, 'x': x, 'y': y, 'speed': car.speed, 'distToCrossroad': line.spawnDistance,
+                         'distToSpawnpoint': car.distToSpawnpoint, 'waitingTime': car.waitingTime, 'passed': False,
+                         'line': i, 'destinationLine': self.lineIndex[car.destinationLine]})
+        if rows:
+            cars.extend(rows)
+
+    def getSweepOrder(self):
+        # Crossroad.moveCars sweeps the lines in turn, each from the leading car backwards, first the cars before
+        # the crossroad, then those after it. Both lists are ordered by how far their cars got along the line,
+        # unless a car overtook another on the crossroad, which keeps its place in carsAfterCrossroad there
+        cars = self.cars
+        progress = np.where(self.lineVertical[cars.line], cars.y, cars.x) * self.lineSign[cars.line]
+        return np.lexsort((-progress, cars.passed, cars.line))
+
+    def findLeaders(self, order, can_lead):
+        # (followers, their leaders) as rows: before the crossroad a car follows the car right in front of it
+        # unless that one has just entered the crossroad, after it the nearest car in front that did not turn
+        # away from the line. can_lead is indexed by row
+        cars = self.cars
+        line = cars.line[order]
+        passed = cars.passed[order]
+        can_lead = can_lead[order]
+        position = np.arange(len(order))
+        first = np.ones(len(order), np.bool_)
+        first[1:] = (line[1:] != line[:-1]) | (passed[1:] != passed[:-1])
+        list_start = np.maximum.accumulate(np.where(first, position, 0))
+        leader = np.full(len(order), -1)
+        leader[1:] = np.maximum.accumulate(np.where(can_lead, position, -1))[:-1]
+        has_leader = (leader >= list_start) & (passed | (leader == position - 1))
+        return order[has_leader], order[leader[has_leader]]
+
+    def moveCars(self):
+        # Car.update and Car.move for all cars. Each car is blocked or drives on, either way its new position
+        # follows from its own state, so both are worked out first. Which one applies to a car depends on where
+        # its leader ends up, which is settled by repeating the leader check until no car changes its mind:
+        # the first car of each line is settled after one round, the second one after two and so on
+        cars = self.cars
+        if not len(cars):
+            self.updateApproaches()
+            return
+        ticks = self.physicsTicks
+        order = self.getSweepOrder()
+        x, y = cars.x, cars.y
+        line = cars.line
+        passed = cars.passed
+        dist = cars.distToCrossroad
+        off_screen = ~((-3 * CIRCLE_RAD < x) & (x < self.lineScreenRight[line]) &
+                       (-3 * CIRCLE_RAD < y) & (y < self.lineScreenBottom[line]))
+
+        # turning onto the destination line once its coordinate is reached
+        vertical = self.lineVertical[line]
+        along = np.where(vertical, y, x)
+        destination = cars.destinationLine
+        destination_coordinate = self.lineCoordinate[destination]
+        turning = (self.lineRoad[line] != self.lineRoad[destination]) & \
+                  (np.abs(along - destination_coordinate) < CAR_SPEED * ticks)
+        if turning.any():
+            x = np.where(turning & ~vertical, destination_coordinate, x)
+            y = np.where(turning & vertical, destination_coordinate, y)
+            line = np.where(turning, destination, line)
+            vertical = self.lineVertical[line]
+            along = np.where(vertical, y, x)
+        sign = self.lineSign[line]
+        start = self.lineCrossroadStart[line]
+        end = self.lineCrossroadEnd[line]
+        on_crossroad = (start < along) & (along < end)
+        now_passed = passed | on_crossroad
+        stopped = ~now_passed & (self.lineLightColor[line] != 0) & (dist < STOP_DISTANCE)
+
+        free_speed = np.minimum(cars.speed + CAR_SPEED / 50 * ticks, CAR_SPEED)
+        braking_speed = np.maximum(cars.speed - CAR_SPEED / 2 * ticks, 0)
+
+        def get_dist(speed):
+            # distToCrossroad shrinks before the crossroad, stands still on it and grows after it
+            delta = speed * ticks
+            new_along = along + delta * sign
+            leaving = ~((start < new_along) & (new_along < end))
+            return np.where(now_passed, np.where(leaving, dist + delta, dist), dist - delta)
+        free_dist = get_dist(free_speed)
+        braking_dist = get_dist(braking_speed)
+
+        blocked = stopped
+        followers, leaders = self.findLeaders(order, np.where(passed, ~turning | off_screen, ~now_passed))
+        checked = ~on_crossroad[followers]
+        followers, leaders = followers[checked], leaders[checked]
+        if len(followers):
+            follower_dist = dist[followers]
+            follower_passed = passed[followers]
+            follower_stopped = stopped[followers]
+            leader_free_dist = free_dist[leaders]
+            leader_braking_dist = braking_dist[leaders]
+            follower_blocked = follower_stopped
+            while True:
+                leader_dist = np.where(blocked[leaders], leader_braking_dist, leader_free_dist)
+                gap = np.where(follower_passed, leader_dist - follower_dist, follower_dist - leader_dist)
+                now_blocked = follower_stopped | (gap < HEADWAY)
+                if np.array_equal(now_blocked, follower_blocked):
+                    break
+                follower_blocked = now_blocked
+                blocked = stopped.copy()
+                blocked[followers] = now_blocked
+
+        speed = np.where(blocked, braking_speed, free_speed)
+        delta = speed * ticks
+        along = along + delta * sign
+        cars.x = np.where(vertical, x, along)
+        cars.y = np.where(vertical, along, y)
+        cars.speed = speed
+        cars.line = line
+        cars.passed = now_passed
+        cars.distToCrossroad = np.where(blocked, braking_dist, free_dist)
+        cars.distToSpawnpoint = cars.distToSpawnpoint + delta
+        cars.waitingTime = np.where(blocked, cars.waitingTime + ticks / 60, cars.waitingTime)
+        if blocked.any():
+            self.addWaitingCars(blocked)
+        if off_screen.any():
+            self.removeCars(order[off_screen[order]])
+        self.updateApproaches()
+
+    def addWaitingCars(self, blocked):
+        cars = self.cars
+        ticks = self.physicsTicks
+        crossroads = self.lineCrossroad[cars.line[blocked]]
+        counts = np.bincount(crossroads, minlength=len(self.crossroads))
+        longest = np.zeros(len(self.crossroads))
+        np.maximum.at(longest, crossroads, cars.waitingTime[blocked])
+        for k in np.flatnonzero(counts).tolist():
+            crossroad = self.crossroads[k]
+            crossroad.waitingCars += int(counts[k]) * ticks
+            if longest[k] > crossroad.maxWaitingTime:
+                crossroad.maxWaitingTime = float(longest[k])
+
+    def removeCars(self, rows):
+        # Crossroad.removeCar for the cars that left the screen, in sweep order so the sums add up the same way
+        cars = self.cars
+        for line, waiting_time in zip(cars.line[rows].tolist(), cars.waitingTime[rows].tolist()):
+            crossroad = self.crossroads[self.lineCrossroad[line]]
+            if waiting_time > crossroad.maxWaitingTime:
+                crossroad.maxWaitingTime = waiting_time
+            crossroad.sumWaitingTimeOfProcessedCars += waiting_time
+            crossroad.processedCars += 1
+            crossroad.carsOnRoads -= 1
+            if crossroad.exits is not None:
+                crossroad.exits.append(self.lines[line])
+        keep = np.ones(len(cars), np.bool_)
+        keep[rows] = False
+        cars.keep(keep)
+
+    def updateApproaches(self):
+        # per line aggregates of the cars before the crossroad, gathered once per tick for getApproachInputs
+        cars = self.cars
+        approaching = ~cars.passed
+        line = cars.line[approaching]
+        n_lines = len(self.lines)
+        max_waiting_time = np.zeros(n_lines)
+        min_dist = np.full(n_lines, np.inf)
+        np.maximum.at(max_waiting_time, line, cars.waitingTime[approaching])
+        np.minimum.at(min_dist, line, cars.distToCrossroad[approaching])
+        self.lineApproachCount = np.bincount(line, minlength=n_lines).tolist()
+        self.lineApproachMaxWaitingTime = max_waiting_time.tolist()
+        self.lineApproachMinDist = min_dist.tolist()
+
+
+class ArrayCrossroadMixin:
+    # Crossroad whose spawned cars are kept by an ArrayTraffic, its own or the one shared by the crossroads
+    # of a CrossroadBatch. Cars wait in Line.queue as Car objects until they are spawned
+    def initCars(self):
+        ArrayTraffic([self])
+
+    def switcher(self, state):
+        super().switcher(state)
+        self.traffic.setLights(self)
+
+    def addCar(self, route=None):
+        car = super().addCar(route)
+        self.traffic.enqueue(car.line)
+        return car
+
+    def addArrivals(self):
+        for _ in range(self.physicsTicks):
+            self.addArrivingCars()
+
+    def spawnCars(self):
+        # a CrossroadBatch adds the arrivals of each of its crossroads, then spawns the cars of all of them at once
+        self.addArrivals()
+        self.traffic.spawnCars()
+
+    def moveCars(self):
+        self.traffic.moveCars()
+
+    def getMovingCarCount(self):
+        return self.traffic.getCarCount(self)
+
+    def getQuietTicks(self, limit):
+        # a vectorised tick costs about the same with few cars as with many, so ticks are never skipped
+        return 0
+
+    def getApproachInputs(self, road_id, line1_id, line2_id):
+        traffic = self.traffic
+        line1 = self.roads[road_id].lines[line1_id]
+        line2 = self.roads[road_id].lines[line2_id]
+        i, j = traffic.lineIndex[line1], traffic.lineIndex[line2]
+        count = len(line1.queue) + len(line2.queue) + traffic.lineApproachCount[i] + traffic.lineApproachCount[j]
+        return (count, max(traffic.lineApproachMaxWaitingTime[i], traffic.lineApproachMaxWaitingTime[j]),
+                min(traffic.lineApproachMinDist[i], traffic.lineApproachMinDist[j]))
+
+    def drawCars(self, screen):
+        import pygame as pg
+        traffic = self.traffic
+        cars = traffic.cars
+        mine = traffic.lineCrossroad[cars.line] == self.trafficIndex
+        # Car.wait shifts the colour by 0.5 per waited frame, i.e. 30 per second of waiting
+        shift = cars.waitingTime[mine] * 30
+        red = np.minimum(shift, 255)
+        green = np.maximum(255 - shift, 0)
+        for x, y, r, g in zip(cars.x[mine].tolist(), cars.y[mine].tolist(), red.tolist(), green.tolist()):
+            pg.draw.circle(screen, (r, g, 0), (x, y), CIRCLE_RAD)
@@ -0,0 +1,194 @@
+from array_simulation import ArrayCrossroadMixin, ArrayTraffic
+from compiled_network import CompiledNetwork
+from constants import MAX_PROBE_BACKOFF
+import profiling
+
+# microseconds per NumPy call of the compiled pass and per node and link of neat's activate, fitted to timings of
+# 2 to 64 networks of fresh and mutated populations; the compiled pass is used where it comes out cheaper
+COMPILED_CALL_COST = 2.3
+NEAT_NODE_COST = 2.7
+NEAT_LINK_COST = 0.1
+
+
+class CrossroadBatch:
+    # steps many independent crossroads in lockstep, one phase at a time for the whole batch,
+    # so the traffic light networks of all crossroads are fed within a single pass per tick.
+    # The crossroads share their decision interval and physics step, so their decisions fall due together.
+    # Event driven crossroads are only stepped when one of them has something happening.
+    # Crossroads truncated by run(threshold=...) drop out of the batch while the others go on.
+    # ArrayCrossroads share one ArrayTraffic, so the cars of all of them are moved in a single pass
+    def __init__(self, crossroads, compiled=None):
+        self.crossroads = crossroads
+        self.traffic = None
+        if crossroads and isinstance(crossroads[0], ArrayCrossroadMixin):
+            self.traffic = ArrayTraffic(crossroads)
+        self.physicsTicks = crossroads[0].physicsTicks if crossroads else 1
+        self.eventDriven = crossroads[0].eventDriven if crossroads else False
+        self.ticks = 0
+        self.profiler = profiling.active  # times the phases of step for the whole batch when set
+        self.compiled = compiled  # whether the networks are fed by a CompiledNetwork, worked out when None
+        self.setActive(crossroads)
+
+    def setActive(self, crossroads):
+        # the crossroads still being stepped
+        self.active = crossroads
+        if self.traffic is not None:
+            self.traffic.setActive(crossroads)
+        self.managed = [crossroad for crossroad in crossroads if crossroad.net is not None]
+        self.unmanaged = [crossroad for crossroad in crossroads if crossroad.net is None]
+        self.nets = [crossroad.net for crossroad in self.managed]
+
+        # one network under many seeds is batched over rows, different networks are compiled side by side
+        self.compiledNet = None
+        if self.compiled is not False and self.nets:
+            if all(net is self.nets[0] for net in self.nets):
+                compiled_net = CompiledNetwork(self.nets[:1])
+            else:
+                compiled_net = CompiledNetwork(self.nets)
+            if self.compiled or self.isCompiledFaster(compiled_net):
+                self.compiledNet = compiled_net
+
+    def isCompiledFaster(self, compiled_net):
+        node_evals = [node_eval for net in self.nets for node_eval in net.node_evals]
+        links = sum(len(links) for node, act_func, agg_func, bias, response, links in node_evals)
+        return COMPILED_CALL_COST * compiled_net.numCalls < NEAT_NODE_COST * len(node_evals) + NEAT_LINK_COST * links
+
+    @classmethod
+    def fromNets(cls, crossroad_class, nets, seeds=None, compiled=None, decision_interval=None, physics_ticks=1,
+                 event_driven=False, schedule=None):
+        # one crossroad per network: a whole population, or the same network repeated for several seeds.
+        # With a schedule every crossroad gets the same arrivals and the seeds no longer matter
+        if seeds is None:
+            seeds = [None] * len(nets)
+        return cls([crossroad_class(net, seed, decision_interval, physics_ticks, event_driven, schedule)
+                    for net, seed in zip(nets, seeds)], compiled)
+
+    def activate(self, inputs):
+        if self.compiledNet is None:
+            return [net.activate(x) for net, x in zip(self.nets, inputs)]
+        if self.compiledNet.numNets == 1:
+            return self.compiledNet.activateBatch([[x] for x in inputs])[:, 0].tolist()
+        return self.compiledNet.activateBatch([inputs])[0].tolist()
+
+    def step(self):
+        if self.profiler is not None:
+            self.stepProfiled()
+            return
+        self.spawnCars()
+        self.moveCars()
+        outputs = [None] * len(self.managed)
+        if self.isDecisionDue():
+            outputs = self.activate(self.getAIInputs())
+        self.manageTrafficLights(outputs)
+        self.updateStatistics()
+        self.ticks += self.physicsTicks
+
+    def stepProfiled(self):
+        profiler = self.profiler
+        profiler.call('spawn', self.spawnCars)
+        moving_cars = sum(crossroad.getMovingCarCount() for crossroad in self.active)
+        profiler.count('carMoves', moving_cars * self.physicsTicks)
+        profiler.count('queuedCarTicks', (sum(crossroad.carsOnRoads for crossroad in self.active) - moving_cars)
+                       * self.physicsTicks)
+        profiler.call('move', self.moveCars)
+        outputs = [None] * len(self.managed)
+        if self.isDecisionDue():
+            inputs = profiler.call('inputs', self.getAIInputs)
+            outputs = profiler.call('network', self.activate, inputs)
+        profiler.call('controller', self.manageTrafficLights, outputs)
+        profiler.call('statistics', self.updateStatistics)
+        profiler.count('ticks', self.physicsTicks * len(self.active))
+        self.ticks += self.physicsTicks
+
+    def spawnCars(self):
+        if self.traffic is not None:
+            for crossroad in self.active:
+                crossroad.addArrivals()
+            self.traffic.spawnCars()
+            return
+        for crossroad in self.active:
+            crossroad.spawnCars()
+
+    def moveCars(self):
+        if self.traffic is not None:
+            self.traffic.moveCars()
+            return
+        for crossroad in self.active:
+            crossroad.moveCars()
+
+    def isDecisionDue(self):
+        return bool(self.managed) and self.managed[0].isDecisionDue()
+
+    def getAIInputs(self):
+        return [crossroad.getAIInputs() for crossroad in self.managed]
+
+    def manageTrafficLights(self, outputs):
+        for crossroad, output in zip(self.managed, outputs):
+            crossroad.trafficLightManagerAI(output)
+        for crossroad in self.unmanaged:
+            crossroad.trafficLightManager()
+
+    def updateStatistics(self):
+        for crossroad in self.active:
+            crossroad.updateStatistics()
+
+    def run(self, n_ticks, threshold=None):
+        renderers = [crossroad.renderer for crossroad in self.crossroads if crossroad.renderer is not None]
+        if not self.eventDriven:
+            for _ in range(n_ticks // self.physicsTicks):
+                self.step()
+                for renderer in renderers:
+                    renderer.update(self.physicsTicks)
+                if not self.checkTruncation(threshold):
+                    return
+            return
+
+        # probes back off like in Crossroad.run
+        backoff = 0
+        ticks_to_probe = 0
+        while n_ticks > 0:
+            if ticks_to_probe > 0:
+                ticks_to_probe -= 1
+                quiet_ticks = 0
+            else:
+                if self.profiler is None:
+                    quiet_ticks = self.getQuietTicks(n_ticks)
+                    self.skipTicks(quiet_ticks)
+                else:
+                    quiet_ticks = self.profiler.call('quiet', self.getQuietTicks, n_ticks)
+                    self.profiler.call('skip', self.skipTicks, quiet_ticks)
+                    self.profiler.count('skippedTicks', quiet_ticks * len(self.active))
+                if quiet_ticks:
+                    backoff = 0
+                else:
+                    backoff = min(2 * backoff or 1, MAX_PROBE_BACKOFF)
+                    ticks_to_probe = backoff
+            self.ticks += quiet_ticks
+            n_ticks -= quiet_ticks
+            if n_ticks > 0:
+                self.step()
+                n_ticks -= 1
+            for renderer in renderers:
+                renderer.update(quiet_ticks + 1)
+            if not self.checkTruncation(threshold):
+                return
+
+    def getQuietTicks(self, limit):
+        for crossroad in self.active:
+            limit = crossroad.getQuietTicks(limit)
+        return limit
+
+    def skipTicks(self, n_ticks):
+        for crossroad in self.active:
+            crossroad.skipTicks(n_ticks)
+
+    def checkTruncation(self, threshold):
+        # drops the crossroads whose fitness can no longer reach threshold, returns whether any are left
+        if threshold is not None:
+            hopeless = [crossroad.checkTruncation(threshold) for crossroad in self.active]
+            if any(hopeless):
+                self.setActive([crossroad for crossroad, truncated in zip(self.active, hopeless) if not truncated])
+        return bool(self.active)
+
+    def getFitness(self):
+        return [crossroad.getFitness() for crossroad in self.crossroads]
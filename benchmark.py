@@ -0,0 +1,118 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+from batch_simulation import CrossroadBatch
+from evaluation import LAYOUTS, get_crossroad_class
+from intersection import load_network
+
+SPAWN_RATES = (1, 5, 10, 20)  # cars per second
+CONTROLLERS = ('fixed', 'ai')
+PHASES = ('spawn', 'move', 'controller', 'statistics')
+
+
+def simulate(batch, n_ticks):
+    # CrossroadBatch.step with every phase timed; cars leaving the screen are removed within the move sweep
+    def control():
+        outputs = batch.activate(batch.getAIInputs()) if batch.isDecisionDue() else [None] * len(batch.managed)
+        batch.manageTrafficLights(outputs)
+
+    phases = [batch.spawnCars, batch.moveCars, control, batch.updateStatistics]
+    timings = [0.0] * len(phases)
+    car_ticks = 0
+    max_cars = 0
+    clock = time.perf_counter
+    for _ in range(n_ticks // batch.physicsTicks):
+        for i, phase in enumerate(phases):
+            start = clock()
+            phase()
+            timings[i] += clock() - start
+        for crossroad in batch.crossroads:
+            car_ticks += crossroad.carsOnRoads * crossroad.physicsTicks
+            max_cars = max(max_cars, crossroad.carsOnRoads)
+    return dict(zip(PHASES, timings)), car_ticks, max_cars
+
+
+def make_batch(layout, spawn_rate, controller, net, seed, vectorised, batch_size):
+    # crossroads of seeds seed, seed + 1, ... stepped in lockstep; a batch of one steps like a lone crossroad
+    crossroad_class = get_crossroad_class(layout, vectorised)
+    batch = CrossroadBatch([crossroad_class(net if controller == 'ai' else None, seed + i) for i in range(batch_size)])
+    for crossroad in batch.crossroads:
+        crossroad.spawnRate = spawn_rate
+    return batch
+
+
+def run_scenario(layout, spawn_rate, controller, net=None, seed=0, seconds=60, vectorised=False, memory=True,
+                 batch_size=1):
+    # one fixed seed episode of the layout at spawn_rate cars per second, for each crossroad of the batch.
+    # Ticks are counted per crossroad
+    simulation = LAYOUTS[layout]
+    n_ticks = int(seconds * simulation.FPS)
+    batch = make_batch(layout, spawn_rate, controller, net, seed, vectorised, batch_size)
+    start = time.perf_counter()
+    timings, car_ticks, max_cars = simulate(batch, n_ticks)
+    elapsed = time.perf_counter() - start
+
+    # tracemalloc slows the simulation down several times, so memory is measured in a second run
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        simulate(make_batch(layout, spawn_rate, controller, net, seed, vectorised, batch_size), n_ticks)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    n_ticks *= batch_size
+    return {'layout': layout, 'spawnRate': spawn_rate, 'controller': controller, 'vectorised': vectorised,
+            'batchSize': batch_size, 'seed': seed, 'ticks': n_ticks, 'seconds': elapsed,
+            'ticksPerSecond': n_ticks / elapsed, 'carTicksPerSecond': car_ticks / elapsed,
+            'meanCars': car_ticks / n_ticks, 'maxCars': max_cars,
+            'processedCars': sum(crossroad.processedCars for crossroad in batch.crossroads),
+            'fitness': sum(batch.getFitness()) / batch_size, 'phases': timings, 'peakMemory': peak_memory}
+
+
+def run_benchmark(layouts=tuple(LAYOUTS), spawn_rates=SPAWN_RATES, controllers=CONTROLLERS, net=None, seed=0,
+                  seconds=60, vectorised=False, memory=True, batch_size=1):
+    if net is None and 'ai' in controllers:
+        net = load_network()
+    results = []
+    for layout in layouts:
+        for spawn_rate in spawn_rates:
+            for controller in controllers:
+                result = run_scenario(layout, spawn_rate, controller, net, seed, seconds, vectorised, memory,
+                                      batch_size)
+                print(format_result(result), flush=True)
+                results.append(result)
+    return results
+
+
+def format_result(result):
+    phases = ' '.join(f"{phase} {1e6 * t / result['ticks']:.1f}" for phase, t in result['phases'].items())
+    memory = f"{result['peakMemory'] / 2 ** 10:.0f} KiB" if result['peakMemory'] is not None else '-'
+    return (f"{result['layout']:8} {result['spawnRate']:>4} cars/s {result['controller']:5} "
+            f"{result['ticksPerSecond']:9.0f} ticks/s {result['carTicksPerSecond']:11.0f} car*ticks/s "
+            f"{result['meanCars']:6.1f} cars  us/tick: {phases}  peak {memory}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure how fast the crossroads are simulated.")
+    parser.add_argument('--layouts', nargs='+', choices=sorted(LAYOUTS), default=sorted(LAYOUTS))
+    parser.add_argument('--spawn-rates', nargs='+', type=int, default=list(SPAWN_RATES), help="cars per second")
+    parser.add_argument('--controllers', nargs='+', choices=CONTROLLERS, default=list(CONTROLLERS))
+    parser.add_argument('--genome', default="traffic_manager_AI.pkl", help="genome of the ai controller")
+    parser.add_argument('--config', default="config.txt")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=60, help="simulated seconds per scenario")
+    parser.add_argument('--vectorised', action='store_true', help="keep cars in NumPy arrays, see array_simulation")
+    parser.add_argument('--batch', type=int, default=1,
+                        help="crossroads of consecutive seeds stepped in lockstep, see CrossroadBatch")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run of every scenario")
+    parser.add_argument('--json', default=None, help="file to write the results to")
+    args = parser.parse_args()
+
+    net = load_network(args.genome, args.config) if 'ai' in args.controllers else None
+    results = run_benchmark(args.layouts, args.spawn_rates, args.controllers, net, args.seed, args.seconds,
+                            args.vectorised, not args.no_memory, args.batch)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
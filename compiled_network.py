@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class CompiledLayer:
+    # nodes of one or more networks that share an aggregation and whose inputs are all known
+    # once the previous layers are done
+    def __init__(self, is_max, targets, biases, responses, links):
+        self.isMax = is_max
+        self.targets = np.array(targets, np.int64)
+        self.biases = np.array(biases, np.float64)[:, None]
+        self.responses = np.array(responses, np.float64)[:, None]
+        # ranks[k] holds the k-th incoming link of every node that has more than k of them:
+        # (positions of those nodes in the layer or None for all of them, source slots, weights)
+        self.ranks = []
+        for k in range(max([len(node_links) for node_links in links], default=0)):
+            positions = [i for i, node_links in enumerate(links) if len(node_links) > k]
+            self.ranks.append((None if len(positions) == len(links) else np.array(positions, np.int64),
+                               np.array([links[i][k][0] for i in positions], np.int64),
+                               np.array([links[i][k][1] for i in positions], np.float64)[:, None]))
+
+
+class CompiledNetwork:
+    # several neat FeedForwardNetworks flattened into one program of NumPy ops, so a whole population
+    # (or one network under many seeds) is fed in a single pass per tick. All node values live in one
+    # array with a row per slot and a column per batch entry; the inputs of every network come first.
+    # Links are applied in the order FeedForwardNetwork.activate applies them, so sums and maxima
+    # come out the same as neat's, only computed for every node of a layer at once.
+    def __init__(self, nets):
+        import neat  # already loaded by whoever built the networks
+        self.numNets = len(nets)
+        self.numInputs = len(nets[0].input_nodes)
+        self.numOutputs = len(nets[0].output_nodes)
+
+        slots = []  # node key -> slot, per network
+        for j, net in enumerate(nets):
+            if len(net.input_nodes) != self.numInputs or len(net.output_nodes) != self.numOutputs:
+                raise ValueError("All networks must have the same number of inputs and outputs")
+            slots.append({key: j * self.numInputs + i for i, key in enumerate(net.input_nodes)})
+        self.numSlots = self.numNets * self.numInputs
+
+        layers = []
+        for net, net_slots in zip(nets, slots):
+            depth = {key: 0 for key in net.input_nodes}
+            for node, act_func, agg_func, bias, response, links in net.node_evals:
+                if act_func is not neat.activations.tanh_activation:
+                    raise ValueError(f"Unsupported activation function of node {node}")
+                if agg_func not in (neat.aggregations.sum_aggregation, neat.aggregations.max_aggregation):
+                    raise ValueError(f"Unsupported aggregation function of node {node}")
+                depth[node] = 1 + max([depth.get(i, 0) for i, w in links], default=0)
+                while len(layers) < depth[node]:
+                    layers.append({False: [], True: []})
+                is_max = agg_func is neat.aggregations.max_aggregation
+                layers[depth[node] - 1][is_max].append((self.slotOf(net_slots, node), bias, response,
+                                                        [(self.slotOf(net_slots, i), w) for i, w in links]))
+            for key in net.output_nodes:
+                self.slotOf(net_slots, key)
+
+        self.layers = [CompiledLayer(is_max, *zip(*nodes)) for layer in layers
+                       for is_max, nodes in layer.items() if nodes]
+        self.outputSlots = np.array([net_slots[key] for net, net_slots in zip(nets, slots)
+                                     for key in net.output_nodes], np.int64)
+        # NumPy calls of one activateBatch, roughly, see activateLayer; they cost the same for any number of rows
+        self.numCalls = sum(3 * len(layer.ranks) + 8 for layer in self.layers)
+
+    @classmethod
+    def fromGenomes(cls, genomes, config):
+        import neat
+        return cls([neat.nn.FeedForwardNetwork.create(genome, config) for genome in genomes])
+
+    def slotOf(self, net_slots, key):
+        if key not in net_slots:
+            net_slots[key] = self.numSlots
+            self.numSlots += 1
+        return net_slots[key]
+
+    def activateBatch(self, inputs):
+        # inputs: (rows, numNets, numInputs) -> outputs: (rows, numNets, numOutputs)
+        inputs = np.asarray(inputs, np.float64)
+        rows = inputs.shape[0]
+        values = np.zeros((self.numSlots, rows))
+        values[:self.numNets * self.numInputs] = inputs.reshape(rows, -1).T
+
+        with np.errstate(invalid='ignore'):  # inf - inf gives nan, as it does in neat
+            for layer in self.layers:
+                values[layer.targets] = self.activateLayer(layer, values)
+        return values[self.outputSlots].T.reshape(rows, self.numNets, self.numOutputs)
+
+    def activateLayer(self, layer, values):
+        # sum() adds the values one by one to 0, max() only replaces the running maximum
+        # by a strictly greater value; both are kept in that order here
+        s = np.zeros((len(layer.targets), values.shape[1]))
+        for k, (positions, sources, weights) in enumerate(layer.ranks):
+            x = values[sources] * weights
+            if positions is None:
+                if not layer.isMax:
+                    s += x
+                elif k == 0:
+                    s = x
+                else:
+                    s = np.where(x > s, x, s)
+            elif not layer.isMax:
+                s[positions] += x
+            elif k == 0:
+                s[positions] = x
+            else:
+                acc = s[positions]
+                s[positions] = np.where(x > acc, x, acc)
+        z = 2.5 * (layer.biases + layer.responses * s)
+        # tanh_activation clamps with max(-60, min(60, z)), which turns nan into 60
+        z = np.where(np.isnan(z), 60.0, np.clip(z, -60.0, 60.0))
+        # np.tanh may differ from the math.tanh of neat in the last bit, never in the sign a decision is taken on
+        return np.tanh(z)
+
+    def activate(self, inputs):
+        # drop-in for FeedForwardNetwork.activate of a single compiled network
+        if self.numNets != 1 or len(inputs) != self.numInputs:
+            raise RuntimeError(f"Expected {self.numInputs} inputs of a single network, got {len(inputs)}")
+        return self.activateBatch([[inputs]])[0, 0].tolist()
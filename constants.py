@@ -0,0 +1,22 @@
+import math
+
+# constants of the simulation, kept apart from intersection so array_simulation can use them as well
+
+FPS = 60
+SCALE = 0.5
+ROAD_WIDTH = int(280 * SCALE)
+BROKEN_LINE_WIDTH = int(12 * SCALE)
+BROKEN_LINE_LENGTH = int(30 * SCALE)
+CAR_SPEED = int(8 * SCALE)
+CIRCLE_RAD = int(25 * SCALE)
+OPTIMAL_DISTANCE = math.sqrt(2 * CIRCLE_RAD ** 2) - CIRCLE_RAD // 2
+GREEN = (0, 255, 0)
+YELLOW = (255, 255, 0)
+RED = (255, 0, 0)
+TRAFFIC_LIGHT_COLORS = [GREEN, YELLOW, RED]
+TRAFFIC_LIGHT_WIDTH = int(20 * SCALE)
+YELLOW_TIME = 0.5
+SPAWNRATE = 5  # cars per second
+MAX_PROBE_BACKOFF = 16  # ticks, see Crossroad.run
+SIMULATION_VERSION = 1  # raised whenever episodes play out differently, so cached fitnesses of older runs go unused
+TRUNCATION_PENALTY = 100  # taken off the fitness of an episode truncated before its first tick, see getEpisodeFitness
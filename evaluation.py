@@ -0,0 +1,345 @@
+import multiprocessing
+import numpy as np
+
+from batch_simulation import CrossroadBatch
+from constants import SIMULATION_VERSION
+from fitness_cache import config_digest, genome_key
+from profiling import PhaseProfiler, run_profiled
+from traffic_schedule import attach_schedule, generate_schedule, share_schedule
+import ordinary_intersection_simulation
+import tshaped_intersection_simulation
+
+LAYOUTS = {'ordinary': ordinary_intersection_simulation, 'tshaped': tshaped_intersection_simulation}
+EPISODE_TIME = 100  # simulated seconds per genome evaluation
+
+AGGREGATES = ('mean', 'worst')
+MAX_FITNESS = 100  # no episode scores more, see Crossroad.getFitness
+
+worker = None  # (config, settings, episodes, aggregate, shared memory) of a pool worker, see init_worker
+
+
+def get_crossroad_class(layout, vectorised=False):
+    simulation = LAYOUTS[layout]
+    return simulation.ArrayCrossroad if vectorised else simulation.Crossroad
+
+
+def create_network(genome, config):
+    # neat is imported here rather than at the top, so the simulation modules load without it
+    import neat
+    return neat.nn.FeedForwardNetwork.create(genome, config)
+
+
+def watch_crossroad(crossroad, fps):
+    from rendering import Renderer
+    Renderer(fps=fps).attach(crossroad)
+
+
+def eval_genome(genome, config, layout='tshaped', episode_time=EPISODE_TIME, seed=None, vectorised=False,
+                decision_interval=None, physics_ticks=1, event_driven=False, schedule=None, threshold=None,
+                watch=None):
+    # with a threshold the episode is cut short once the fitness can no longer reach it, and (fitness, truncated)
+    # is returned instead of the fitness alone, a truncated one scored by Crossroad.getEpisodeFitness.
+    # With watch the episode is shown in a window at that many frames per second as it runs
+    simulation = LAYOUTS[layout]
+    net = create_network(genome, config)
+    crossroad = get_crossroad_class(layout, vectorised)(net, seed, decision_interval, physics_ticks, event_driven,
+                                                        schedule)
+    if watch:
+        watch_crossroad(crossroad, watch)
+    n_ticks = int(episode_time * simulation.FPS)
+    crossroad.run(n_ticks, threshold)
+    if crossroad.renderer is not None:
+        crossroad.renderer.close()
+    if threshold is not None:
+        return crossroad.getEpisodeFitness(n_ticks, threshold), crossroad.truncated
+    return crossroad.getFitness()
+
+
+def eval_genome_batch(genomes, config, layout='tshaped', episode_time=EPISODE_TIME, seeds=None, vectorised=False,
+                      decision_interval=None, physics_ticks=1, event_driven=False, schedule=None, threshold=None,
+                      watch=None):
+    # simulates several genomes (or one genome under several seeds) in lockstep in this process
+    simulation = LAYOUTS[layout]
+    # a genome repeated for several seeds shares one network, which the batch then feeds in one pass
+    nets_by_genome = {}
+    for genome in genomes:
+        if id(genome) not in nets_by_genome:
+            nets_by_genome[id(genome)] = create_network(genome, config)
+    nets = [nets_by_genome[id(genome)] for genome in genomes]
+    batch = CrossroadBatch.fromNets(get_crossroad_class(layout, vectorised), nets, seeds,
+                                    decision_interval=decision_interval, physics_ticks=physics_ticks,
+                                    event_driven=event_driven, schedule=schedule)
+    if watch:
+        watch_crossroad(batch.crossroads[0], watch)
+    n_ticks = int(episode_time * simulation.FPS)
+    batch.run(n_ticks, threshold)
+    if batch.crossroads[0].renderer is not None:
+        batch.crossroads[0].renderer.close()
+    if threshold is not None:
+        return [(crossroad.getEpisodeFitness(n_ticks, threshold), crossroad.truncated)
+                for crossroad in batch.crossroads]
+    return batch.getFitness()
+
+
+def aggregate_fitness(fitnesses, aggregate='mean'):
+    if aggregate == 'worst':
+        return min(fitnesses)
+    return sum(fitnesses) / len(fitnesses)
+
+
+def episode_threshold(threshold, fitnesses, n_episodes, aggregate='mean'):
+    # what the next episode has to be able to reach for the aggregate over all n_episodes to reach threshold,
+    # given the fitnesses of the episodes played so far and counting the episodes after it as MAX_FITNESS
+    if threshold is None or aggregate == 'worst':
+        return threshold
+    return n_episodes * threshold - sum(fitnesses) - MAX_FITNESS * (n_episodes - len(fitnesses) - 1)
+
+
+def init_worker(config, settings, episodes, aggregate='mean', schedule_name=None, schedule_length=0):
+    # runs once in every worker of a PopulationEvaluator pool; the config, the episode settings and the
+    # schedules (mapped from shared memory) stay in the worker, so each task only carries its genomes.
+    # episodes are (layout, start, stop) of each episode's rows in the shared schedules, or
+    # (layout, None, None) for random traffic
+    global worker
+    shared, schedules = None, None
+    if schedule_name is not None:
+        shared, schedules = attach_schedule(schedule_name, schedule_length)
+    episodes = [(layout, schedules[start:stop] if start is not None else None) for layout, start, stop in episodes]
+    worker = (config, settings, episodes, aggregate, shared)
+
+
+def eval_task(genome, threshold=None, watch=None):
+    # (fitness of every episode played, truncated); a genome that can no longer reach threshold
+    # skips the episodes after the one it was cut short in
+    config, settings, episodes, aggregate, shared = worker
+    fitnesses = []
+    truncated = False
+    for i, (layout, schedule) in enumerate(episodes):
+        threshold_i = episode_threshold(threshold, fitnesses, len(episodes), aggregate)
+        result = eval_genome(genome, config, layout, schedule=schedule, threshold=threshold_i,
+                             watch=watch if i == 0 else None, **settings)
+        if threshold_i is None:
+            fitnesses.append(result)
+            continue
+        fitness, truncated = result
+        fitnesses.append(fitness)
+        if truncated:
+            break
+    return fitnesses, truncated
+
+
+def eval_task_batch(genomes, threshold=None, watch=None):
+    # eval_task for every genome, each episode played by all genomes not yet truncated in lockstep.
+    # The batch shares one threshold per episode, the lowest one any of its genomes needs
+    config, settings, episodes, aggregate, shared = worker
+    fitnesses = [[] for genome in genomes]
+    truncated = [False] * len(genomes)
+    for i, (layout, schedule) in enumerate(episodes):
+        active = [j for j in range(len(genomes)) if not truncated[j]]
+        if not active:
+            break
+        threshold_i = None
+        if threshold is not None:
+            threshold_i = min(episode_threshold(threshold, fitnesses[j], len(episodes), aggregate) for j in active)
+        results = eval_genome_batch([genomes[j] for j in active], config, layout, schedule=schedule,
+                                    threshold=threshold_i, watch=watch if i == 0 else None, **settings)
+        for j, result in zip(active, results):
+            if threshold_i is None:
+                fitnesses[j].append(result)
+            else:
+                fitness, truncated[j] = result
+                fitnesses[j].append(fitness)
+    return list(zip(fitnesses, truncated))
+
+
+class PopulationEvaluator:
+    # scores every genome of a generation on a pool of worker processes, started with the config of the first
+    # generation and kept for the whole run (see init_worker). A genome plays one episode per scenario and seed,
+    # all genomes under the same schedules; its fitness is the mean or the worst of them, both kept in scores
+    # by genome id. The ids of the genomes whose episodes were cut short are kept in truncated
+    def __init__(self, num_workers=None, layout='tshaped', episode_time=EPISODE_TIME,
+                 batch_size=1,  # genomes a worker simulates in lockstep, see CrossroadBatch
+                 vectorised=False,  # cars kept in NumPy arrays, see array_simulation
+                 decision_interval=None, physics_ticks=1, event_driven=False,  # handed to every Crossroad
+                 schedule_seed=None,  # pre-generated arrivals instead of random traffic, see traffic_schedule
+                 cache=None,  # FitnessCache of genomes already scored, needs the reproducible episodes of a seed
+                 truncate_below=None,  # episodes that can no longer reach this fitness are cut short,
+                 truncate_rank=None,  # nor the truncate_rank-th best fitness of the previous generation
+                 profile=False,  # times the phases of the episodes in the workers, added up in profiler
+                 watch=None,  # frames per second the first episode of every generation is shown at
+                 scenarios=None,  # (layout, spawn rate, imbalance of road 1 against the others) tuples
+                 num_seeds=1,  # schedules every scenario is played under, from schedule_seed (0 by default) on
+                 aggregate='mean'):  # fitness over the episodes, one of AGGREGATES
+        self.pool = None
+        self.sharedSchedule = None
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate {aggregate}, expected one of {AGGREGATES}")
+        if schedule_seed is None and (scenarios is not None or num_seeds > 1):
+            schedule_seed = 0
+        if event_driven and max(round((decision_interval or 0) * LAYOUTS[layout].FPS), 1) == 1:
+            raise ValueError("event_driven needs a decision_interval above one tick, see Crossroad")
+        if cache is not None and schedule_seed is None:
+            raise ValueError("A fitness cache needs a schedule_seed, episodes with random traffic differ every run")
+        self.numWorkers = num_workers or multiprocessing.cpu_count()
+        self.layout = layout
+        self.episodeTime = episode_time
+        self.batchSize = batch_size
+        self.vectorised = vectorised
+        self.decisionInterval = decision_interval
+        self.physicsTicks = physics_ticks
+        self.eventDriven = event_driven
+        self.scenarios = list(scenarios) if scenarios is not None else [(layout, None, 1)]
+        self.numSeeds = num_seeds
+        self.aggregate = aggregate
+        self.scores = {}  # genome id -> (mean, worst) fitness over the episodes
+        self.episodes = [(layout, None, None) for layout, spawn_rate, imbalance in self.scenarios]
+        self.schedule = None  # the schedules of all episodes one after another
+        if schedule_seed is not None:
+            schedules = []
+            self.episodes = []
+            for scenario_layout, spawn_rate, imbalance in self.scenarios:
+                simulation = LAYOUTS[scenario_layout]
+                for seed in range(schedule_seed, schedule_seed + num_seeds):
+                    schedule = generate_schedule(simulation, seed, int(episode_time * simulation.FPS), spawn_rate,
+                                                 {1: imbalance} if imbalance != 1 else None)
+                    start = sum(len(s) for s in schedules)
+                    self.episodes.append((scenario_layout, start, start + len(schedule)))
+                    schedules.append(schedule)
+            self.schedule = np.concatenate(schedules)
+            self.sharedSchedule = share_schedule(self.schedule)
+        # keyword arguments of eval_genome and eval_genome_batch that are the same in every episode
+        self.settings = dict(episode_time=episode_time, vectorised=vectorised, decision_interval=decision_interval,
+                             physics_ticks=physics_ticks, event_driven=event_driven)
+        self.cache = cache
+        # everything besides the genome and the config the fitness depends on
+        self.scenario = (SIMULATION_VERSION, layout, episode_time, vectorised, decision_interval, physics_ticks,
+                         event_driven, schedule_seed, tuple(self.scenarios), num_seeds, aggregate)
+        self.configDigest = None  # of the config the pool was started with, see config_digest
+        self.truncateBelow = truncate_below
+        self.truncateRank = truncate_rank
+        self.threshold = truncate_below
+        self.truncated = []
+        self.profiler = PhaseProfiler() if profile else None
+        self.watch = watch
+        self.config = None
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.sharedSchedule is not None:
+            self.sharedSchedule.close()
+            self.sharedSchedule.unlink()
+            self.sharedSchedule = None
+
+    def startPool(self, config):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        schedule_args = ()
+        if self.sharedSchedule is not None:
+            schedule_args = (self.sharedSchedule.name, len(self.schedule))
+        self.pool = multiprocessing.Pool(self.numWorkers, init_worker,
+                                         (config, self.settings, self.episodes, self.aggregate) + schedule_args)
+        self.config = config
+        self.configDigest = config_digest(config)
+
+    def evaluate(self, genomes, config):
+        if self.pool is None or config is not self.config:
+            self.startPool(config)
+        self.truncated = []
+        self.scores = {}
+        self.evaluateCached(genomes)
+        # printed here rather than by a reporter: neat pickles its reporters into every checkpoint,
+        # and the evaluator holds the pool
+        if self.truncated:
+            print(f'Truncated {len(self.truncated)} of {len(genomes)} genomes')
+        best_id, best = max(genomes, key=lambda item: item[1].fitness)
+        if len(self.episodes) > 1 and best_id in self.scores:
+            mean, worst = self.scores[best_id]
+            print(f'Best genome over {len(self.episodes)} episodes: mean {mean:.3f}, worst {worst:.3f}')
+        self.updateThreshold([genome.fitness for genome_id, genome in genomes])
+
+    def updateThreshold(self, fitnesses):
+        # the k-th best fitness of this generation is what the next one has to beat
+        thresholds = [self.truncateBelow] if self.truncateBelow is not None else []
+        if self.truncateRank and len(fitnesses) >= self.truncateRank:
+            thresholds.append(sorted(fitnesses, reverse=True)[self.truncateRank - 1])
+        self.threshold = max(thresholds) if thresholds else None
+
+    def evaluateCached(self, genomes):
+        if self.cache is None:
+            self.simulate(genomes)
+            return
+
+        # genomes equal to a cached one or to another one of this generation are not simulated again
+        unknown = {}
+        for genome_id, genome in genomes:
+            key = (genome_key(genome), self.configDigest, self.scenario)
+            scores = self.cache.get(key)
+            if scores is not None:
+                self.setScores(genome_id, genome, scores)
+            else:
+                unknown.setdefault(key, []).append((genome_id, genome))
+
+        self.simulate([same[0] for same in unknown.values()])
+        for key, same in unknown.items():
+            scores = self.scores[same[0][0]]
+            for genome_id, genome in same[1:]:
+                self.setScores(genome_id, genome, scores)
+            # a truncated fitness depends on the threshold it was cut at, so it is not kept
+            if same[0][0] in self.truncated:
+                self.truncated.extend(genome_id for genome_id, genome in same[1:])
+            else:
+                self.cache.put(key, scores)
+        self.cache.save()
+
+    def setResult(self, genome_id, genome, result):
+        fitnesses, truncated = result
+        self.setScores(genome_id, genome, (aggregate_fitness(fitnesses), aggregate_fitness(fitnesses, 'worst')))
+        if truncated:
+            self.truncated.append(genome_id)
+
+    def setScores(self, genome_id, genome, scores):
+        # scores are the fitnesses over the episodes in the order of AGGREGATES
+        self.scores[genome_id] = scores
+        genome.fitness = scores[AGGREGATES.index(self.aggregate)]
+
+    def submit(self, function, args):
+        if self.profiler is None:
+            return self.pool.apply_async(function, args)
+        return self.pool.apply_async(run_profiled, (function,) + args)
+
+    def collect(self, job):
+        if self.profiler is None:
+            return job.get()
+        result, profile = job.get()
+        self.profiler.merge(profile)
+        return result
+
+    def simulate(self, genomes):
+        if self.batchSize > 1:
+            self.evaluateBatched(genomes)
+            return
+
+        jobs = []
+        for i, (genome_id, genome) in enumerate(genomes):
+            jobs.append(self.submit(eval_task, (genome, self.threshold, self.watch if i == 0 else None)))
+
+        for job, (genome_id, genome) in zip(jobs, genomes):
+            self.setResult(genome_id, genome, self.collect(job))
+
+    def evaluateBatched(self, genomes):
+        chunks = [genomes[i:i + self.batchSize] for i in range(0, len(genomes), self.batchSize)]
+        jobs = []
+        for i, chunk in enumerate(chunks):
+            jobs.append(self.submit(eval_task_batch, ([genome for genome_id, genome in chunk], self.threshold,
+                                                      self.watch if i == 0 else None)))
+
+        for job, chunk in zip(jobs, chunks):
+            for result, (genome_id, genome) in zip(self.collect(job), chunk):
+                self.setResult(genome_id, genome, result)
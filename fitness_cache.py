@@ -0,0 +1,66 @@
+from collections import OrderedDict
+import hashlib
+import io
+import os
+import pickle
+
+
+def genome_key(genome):
+    # canonical hash of what FeedForwardNetwork.create builds a network from: the nodes and the enabled
+    # connections, in key order, so equal genomes hash alike whatever their id or dict order
+    nodes = sorted((key, node.bias, node.response, node.activation, node.aggregation)
+                   for key, node in genome.nodes.items())
+    connections = sorted((key, connection.weight) for key, connection in genome.connections.items()
+                         if connection.enabled)
+    return hashlib.sha256(repr((nodes, connections)).encode()).hexdigest()
+
+
+def config_digest(config):
+    # hash of the genome section of a neat config, which decides what network a genome becomes
+    text = io.StringIO()
+    config.genome_config.save(text)
+    return hashlib.sha256(text.getvalue().encode()).hexdigest()
+
+
+class FitnessCache:
+    # scores of genomes already simulated, keyed by genome_key, the config and the scenario they were run in.
+    # The least recently used entries are evicted past max_size; with a path the cache is loaded
+    # from and saved to that file, so it survives a resumed run
+    def __init__(self, max_size=10000, path=None):
+        self.maxSize = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                self.entries = pickle.load(f)
+            self.evict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, scores):
+        self.entries[key] = scores
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        if self.path is None:
+            return
+        # written aside and renamed, so an interrupted save never leaves a truncated cache behind
+        with open(self.path + '.tmp', "wb") as f:
+            pickle.dump(self.entries, f)
+        os.replace(self.path + '.tmp', self.path)
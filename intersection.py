@@ -0,0 +1,934 @@
+from collections import deque
+import random
+import math
+import pickle
+
+from array_simulation import ArrayCrossroadMixin
+from constants import (FPS, ROAD_WIDTH, BROKEN_LINE_WIDTH, BROKEN_LINE_LENGTH, CAR_SPEED, CIRCLE_RAD,
+                       OPTIMAL_DISTANCE, TRAFFIC_LIGHT_COLORS, TRAFFIC_LIGHT_WIDTH, YELLOW_TIME, SPAWNRATE,
+                       MAX_PROBE_BACKOFF, TRUNCATION_PENALTY)
+import profiling
+
+# pygame and neat are only imported by the functions that draw or build networks, so the simulation itself
+# runs (and worker processes start) without loading either of them
+
+# (number, orientation, direction of each line) of the vertical road 1 and the horizontal road 2
+ROADS = ((1, 'vertical', ((0, 1), (0, 1), (0, -1), (0, -1))),
+         (2, 'horizontal', ((-1, 0), (-1, 0), (1, 0), (1, 0))))
+# line coordinates relative to the middle of the screen
+LINE_OFFSETS = (-ROAD_WIDTH // 4 - ROAD_WIDTH // 8, -ROAD_WIDTH // 4 + ROAD_WIDTH // 8,
+                ROAD_WIDTH // 4 - ROAD_WIDTH // 8, ROAD_WIDTH // 4 + ROAD_WIDTH // 8)
+# (road, pair of lines) whose approaching cars make up each triple of network inputs
+AI_APPROACHES = ((1, (1, 2)), (1, (3, 4)), (2, (1, 2)), (2, (3, 4)))
+
+
+def distance(p1, p2):
+    return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+
+
+class Layout:
+    # declarative description of a crossroad: the screen it is drawn on, its roads, the lines cars start
+    # on with the (road, line) pairs each of them leads to, the roads of each of the two light groups, the
+    # lines feeding the network and grass covering missing arms. Everything the simulation looks up
+    # about the layout is computed here once rather than by every Crossroad
+    def __init__(self, screen_size, directions, roads=ROADS, light_groups=((1,), (2,)), ai_approaches=AI_APPROACHES,
+                 grass=()):
+        self.screenSize = screen_size
+        self.roads = roads
+        self.directions = directions
+        self.origins = list(directions)
+        self.grass = grass
+        # rects are plain (left, top, width, height) tuples, the simulation only needs them as numbers
+        self.crossroadRect = (screen_size[0] // 2 - ROAD_WIDTH // 2, screen_size[1] // 2 - ROAD_WIDTH // 2,
+                              ROAD_WIDTH, ROAD_WIDTH)
+
+        # (number, coordinate, direction, traffic light rect) of the lines of each road
+        self.lines = {}
+        for number, orientation, line_directions in roads:
+            center = screen_size[0] // 2 if orientation == 'vertical' else screen_size[1] // 2
+            self.lines[number] = [(i + 1, center + offset, direction,
+                                   self.placeTrafficLight(center + offset, direction))
+                                  for i, (offset, direction) in enumerate(zip(LINE_OFFSETS, line_directions))]
+
+        # the whole route table: a line to start on, then one of its directions
+        self.routes = []
+        self.routeWeights = []
+        for road, line in self.origins:
+            for destination_road, destination_line in directions[(road, line)]:
+                self.routes.append((road, line, destination_road, destination_line))
+                self.routeWeights.append(1 / len(self.origins) / len(directions[(road, line)]))
+
+        # light states of the green phase of each group and of the yellow between them; switcher only ever
+        # gets these objects, so a state can be told by identity
+        self.greenStates = [{number: {line[0]: 0 if number in group else 2 for line in self.lines[number]}
+                             for number, orientation, line_directions in roads} for group in light_groups]
+        self.yellowState = {number: {line[0]: 1 for line in self.lines[number]}
+                            for number, orientation, line_directions in roads}
+        self.aiApproaches = [(road - 1, line1 - 1, line2 - 1) for road, (line1, line2) in ai_approaches]
+
+    def placeTrafficLight(self, coordinate, direction):
+        left, top, width, height = self.crossroadRect
+        if direction == (0, -1):
+            return coordinate - ROAD_WIDTH // 8, top + height, ROAD_WIDTH // 4, TRAFFIC_LIGHT_WIDTH
+        elif direction == (0, 1):
+            return coordinate - ROAD_WIDTH // 8, top - TRAFFIC_LIGHT_WIDTH, ROAD_WIDTH // 4, TRAFFIC_LIGHT_WIDTH
+        elif direction == (1, 0):
+            return left - TRAFFIC_LIGHT_WIDTH, coordinate - ROAD_WIDTH // 8, TRAFFIC_LIGHT_WIDTH, ROAD_WIDTH // 4
+        elif direction == (-1, 0):
+            return left + width, coordinate - ROAD_WIDTH // 8, TRAFFIC_LIGHT_WIDTH, ROAD_WIDTH // 4
+
+
+class Crossroad:
+    # the simulation of one crossroad; the layouts subclass it with their own Layout
+    layout = None
+
+    def __init__(self, net=None, seed=None, decision_interval=None, physics_ticks=1, event_driven=False,
+                 schedule=None):
+        if event_driven and physics_ticks != 1:
+            raise ValueError("Event driven stepping skips whole ticks and needs physics_ticks=1")
+        if event_driven and net is not None and max(round((decision_interval or 0) * FPS), 1) == 1:
+            raise ValueError("Event driven stepping needs a decision_interval above one tick, "
+                             "a network deciding every tick leaves no ticks to skip")
+        self.id = 0
+        self.random = random.Random(seed)
+        self.drawnSpawnTicks = deque()  # spawn process drawn ahead by getQuietTicks
+        # cars come from a pre-generated schedule (see traffic_schedule) instead of being drawn when one is given
+        self.arrivals = schedule.tolist() if schedule is not None else None
+        self.nextArrival = 0
+        # whether cars arrive from outside at all, junctions of a CrossroadNetwork may only get them from neighbours
+        self.outsideTraffic = True
+        self.tick = 0
+        self.net = net  # traffic lights are driven by trafficLightManagerAI when a network is given
+        # the network is asked every decision_interval seconds (every tick by default) and every step
+        # simulates physics_ticks ticks of 1 / FPS s at once, see step
+        self.decisionTicks = max(round(decision_interval * FPS), 1) if decision_interval else 1
+        self.ticksToDecision = 0
+        self.physicsTicks = physics_ticks
+        # run jumps over the ticks in which cars only drive on or stand still, see getQuietTicks
+        self.eventDriven = event_driven
+        self.profiler = profiling.active  # times the phases of step when set, see profiling
+        self.renderer = None  # draws the crossroad as run steps it when set, see rendering
+        self.spawnRate = SPAWNRATE  # cars per second
+        self.switchPenalty = 0
+        self.truncated = False  # set when run gave up on the episode, see checkTruncation
+        self.timer = 0
+        self.averageTime = 0
+        self.maxWaitingTime = 0
+        self.sumWaitingTime = 0
+        self.prevCarID = 0
+        self.carsOnRoads = 0
+        self.processedCars = 0
+        self.sumWaitingTimeOfProcessedCars = 0
+        self.waitingCars = 0  # cars that waited during the current tick
+        self.exits = None  # when a list, the line of every car leaving the screen is added to it
+
+        layout = self.layout
+        self.screenSize = layout.screenSize
+        self.roads = []
+        for number, orientation, line_directions in layout.roads:
+            road = Road(number, orientation)
+            for line_number, coordinate, direction, traffic_light_rect in layout.lines[number]:
+                line = Line(line_number, coordinate, direction, layout.screenSize, traffic_light_rect,
+                            layout.crossroadRect)
+                road.lines.append(line)
+            self.roads.append(road)
+        # (road, line) pairs cars start on and those each of them may be headed for, as in layout.directions
+        self.origins = [self.getRoadLine(road, line) for road, line in layout.origins]
+        self.directions = {}
+        for origin, destinations in layout.directions.items():
+            road, line = self.getRoadLine(*origin)
+            self.directions[line] = [self.getRoadLine(*destination) for destination in destinations]
+
+        self.crossroadRect = layout.crossroadRect
+        self.initCars()
+        self.isSwitched = True
+        self.trafficLightsState = layout.greenStates[0]
+        self.switcher(self.trafficLightsState)
+
+    def initCars(self):
+        # cars are kept by their lines, see Line; called before the first switcher so that ArrayCrossroad
+        # has its arrays ready when the lights are set
+        pass
+
+    def getRoadLine(self, road, line):
+        # the Road and Line of a pair of numbers
+        return self.roads[road - 1], self.roads[road - 1].lines[line - 1]
+
+    def trafficLightManager(self):
+        self.timer += self.physicsTicks / FPS
+        if self.timer >= 10:
+            self.timer = 0
+            self.switcher(self.layout.yellowState)
+        elif self.trafficLightsState is self.layout.yellowState and self.timer >= YELLOW_TIME:
+            self.timer = 0
+            if self.isSwitched:
+                self.switcher(self.layout.greenStates[1])
+            else:
+                self.switcher(self.layout.greenStates[0])
+            self.isSwitched = not self.isSwitched
+
+    def minDist(self, road_id, line1_id, line2_id):
+        # approaching cars are ordered by distance to the crossroad, so the nearest one leads its line
+        res = float("inf")
+        for line_id in (line1_id, line2_id):
+            cars = self.roads[road_id].lines[line_id].carsBeforeCrossroad
+            if cars and cars[0].distToCrossroad < res:
+                res = cars[0].distToCrossroad
+        return res
+
+    def getApproachInputs(self, road_id, line1_id, line2_id):
+        # (cars before the crossroad, their max waiting time, distance of the nearest one) for a pair of lines,
+        # read from what each line keeps up to date while its cars spawn, move and pass
+        line1 = self.roads[road_id].lines[line1_id]
+        line2 = self.roads[road_id].lines[line2_id]
+        count = len(line1.queue) + len(line2.queue) + len(line1.carsBeforeCrossroad) + len(line2.carsBeforeCrossroad)
+        max_waiting_time = max(line1.maxWaitingTime, line2.maxWaitingTime)
+        return count, max_waiting_time, self.minDist(road_id, line1_id, line2_id)
+
+    def getAIInputs(self):
+        inputs = []
+        for road_id, line1_id, line2_id in self.layout.aiApproaches:
+            inputs.extend(self.getApproachInputs(road_id, line1_id, line2_id))
+        inputs.append(CAR_SPEED)
+        return inputs
+
+    def isDecisionDue(self):
+        return self.ticksToDecision <= 0
+
+    def trafficLightManagerAI(self, output=None):
+        # output can be computed beforehand when many crossroads are activated at once,
+        # it is only used when a decision is due
+        self.timer += self.physicsTicks / FPS
+        if self.isDecisionDue():
+            self.ticksToDecision += self.decisionTicks
+            if output is None:
+                output = self.net.activate(self.getAIInputs())
+            if output[0] > 0:
+                self.switchPenalty += 0.1
+                self.timer = 0
+                self.switcher(self.layout.yellowState)
+        self.ticksToDecision -= self.physicsTicks
+        if self.trafficLightsState is self.layout.yellowState and self.timer >= YELLOW_TIME:
+            self.timer = 0
+            if self.isSwitched:
+                self.switcher(self.layout.greenStates[1])
+            else:
+                self.switcher(self.layout.greenStates[0])
+            self.isSwitched = not self.isSwitched
+
+    def switcher(self, state):
+        self.trafficLightsState = state
+        for road in self.roads:
+            for line in road.lines:
+                line.trafficLightColor = state[road.number][line.number]
+
+    def updateStatistics(self):
+        # carsOnRoads and maxWaitingTime are kept up to date as cars are added, spawned, wait and leave;
+        # every car that waited this tick adds 1 / 60 s to the total waiting time
+        self.sumWaitingTime += self.waitingCars / 60
+        self.waitingCars = 0
+        if self.carsOnRoads + self.processedCars > 0:
+            self.averageTime = self.sumWaitingTime / (self.carsOnRoads + self.processedCars)
+        else:
+            self.averageTime = 0
+
+    def addCar(self, route=None):
+        # route is a (road, line, destination road, destination line) of numbers picked beforehand
+        new_car = Car()
+        new_car.id = self.prevCarID + 1
+        self.prevCarID = new_car.id
+        self.carsOnRoads += 1
+        if route is not None:
+            new_car.road, new_car.line = self.getRoadLine(route[0], route[1])
+            new_car.destinationRoad, new_car.destinationLine = self.getRoadLine(route[2], route[3])
+            new_car.line.queue.append(new_car)
+            return new_car
+
+        # determining the point of dispatch and where the car is headed
+        new_car.road, new_car.line = self.random.choice(self.origins)
+        new_car.line.queue.append(new_car)
+        new_car.destinationRoad, new_car.destinationLine = self.random.choice(self.directions[new_car.line])
+        return new_car
+
+    def getRouteTable(self):
+        # every route addCar can pick with the probability it picks it
+        return self.layout.routes, self.layout.routeWeights
+
+    def isSpawnTick(self):
+        if self.drawnSpawnTicks:
+            return self.drawnSpawnTicks.popleft()
+        return self.random.randint(1, int(FPS // self.spawnRate)) == 1
+
+    def addArrivingCars(self):
+        # cars arriving in the current tick, taken from the schedule or drawn on the spot
+        if not self.outsideTraffic:
+            pass
+        elif self.arrivals is None:
+            if self.isSpawnTick():
+                self.addCar()
+        else:
+            while self.nextArrival < len(self.arrivals) and self.arrivals[self.nextArrival][0] == self.tick:
+                self.addCar(self.arrivals[self.nextArrival][1:])
+                self.nextArrival += 1
+        self.tick += 1
+
+    def spawnCars(self):
+        for _ in range(self.physicsTicks):
+            self.addArrivingCars()
+        for road in self.roads:
+            for line in road.lines:
+                line.spawnCar(self)
+
+    def moveCars(self):
+        # every line is swept from its leading car backwards, so each car only looks at the car in front of it.
+        # The lists are rebuilt during the sweep without the cars that left the screen, while cars entering
+        # the crossroad or turning onto another line are inserted into their new list once the sweep is over
+        entered = []
+        turned = []
+        for road in self.roads:
+            for line in road.lines:
+                leader = None
+                remaining = []
+                max_waiting_time = 0
+                for car in line.carsBeforeCrossroad:
+                    is_off_screen = car.isOffScreen(self)
+                    car.update(self, leader)
+                    if is_off_screen:
+                        self.removeCar(car)
+                    elif car.passed:
+                        entered.append(car)
+                    else:
+                        remaining.append(car)
+                        if car.waitingTime > max_waiting_time:
+                            max_waiting_time = car.waitingTime
+                    leader = None if car.passed else car
+                line.carsBeforeCrossroad = remaining
+                line.maxWaitingTime = max_waiting_time
+
+                leader = None
+                remaining = []
+                for car in line.carsAfterCrossroad:
+                    is_off_screen = car.isOffScreen(self)
+                    car.update(self, leader)
+                    if is_off_screen:
+                        self.removeCar(car)
+                    elif car.line is not line:
+                        turned.append(car)
+                        continue
+                    else:
+                        remaining.append(car)
+                    leader = car
+                line.carsAfterCrossroad = remaining
+
+        for car in entered + turned:
+            car.line.insertAfterCrossroad(car)
+
+    def removeCar(self, car):
+        # bookkeeping for a car that has left the screen
+        if car.waitingTime > self.maxWaitingTime:
+            self.maxWaitingTime = car.waitingTime
+        self.sumWaitingTimeOfProcessedCars += car.waitingTime
+        self.processedCars += 1
+        self.carsOnRoads -= 1
+        if self.exits is not None:
+            self.exits.append(car.line)
+
+    def manageTrafficLights(self):
+        if self.net is not None:
+            self.trafficLightManagerAI()
+        else:
+            self.trafficLightManager()
+
+    def step(self):
+        # physicsTicks ticks of 1 / FPS s of simulation without any rendering: cars move, wait and
+        # accelerate as much as they would in that many ticks, but only look at each other once
+        if self.profiler is not None:
+            self.stepProfiled()
+            return
+        self.spawnCars()
+        self.moveCars()
+        self.manageTrafficLights()
+        self.updateStatistics()
+
+    def stepProfiled(self):
+        # step with every phase timed, the network apart from the rest of the controller
+        profiler = self.profiler
+        profiler.call('spawn', self.spawnCars)
+        moving_cars = self.getMovingCarCount()
+        profiler.count('carMoves', moving_cars * self.physicsTicks)
+        profiler.count('queuedCarTicks', (self.carsOnRoads - moving_cars) * self.physicsTicks)
+        profiler.call('move', self.moveCars)
+        if self.net is not None and self.isDecisionDue():
+            inputs = profiler.call('inputs', self.getAIInputs)
+            output = profiler.call('network', self.net.activate, inputs)
+            profiler.call('controller', self.trafficLightManagerAI, output)
+        else:
+            profiler.call('controller', self.manageTrafficLights)
+        profiler.call('statistics', self.updateStatistics)
+        profiler.count('ticks', self.physicsTicks)
+
+    def getMovingCarCount(self):
+        # cars that have left their spawn queue
+        return sum(len(line.carsBeforeCrossroad) + len(line.carsAfterCrossroad)
+                   for road in self.roads for line in road.lines)
+
+    def run(self, n_ticks, threshold=None):
+        # with a threshold the episode ends early once its fitness can no longer reach it
+        if not self.eventDriven:
+            for _ in range(n_ticks // self.physicsTicks):
+                self.step()
+                if self.renderer is not None:
+                    self.renderer.update(self.physicsTicks)
+                if self.checkTruncation(threshold):
+                    return
+            return
+
+        # in dense traffic most probes find nothing to skip, so after one that finds nothing the next
+        # 1, 2, 4 ... (at most MAX_PROBE_BACKOFF) ticks are stepped without looking
+        backoff = 0
+        ticks_to_probe = 0
+        while n_ticks > 0:
+            if ticks_to_probe > 0:
+                ticks_to_probe -= 1
+                quiet_ticks = 0
+            else:
+                if self.profiler is None:
+                    quiet_ticks = self.getQuietTicks(n_ticks)
+                    self.skipTicks(quiet_ticks)
+                else:
+                    quiet_ticks = self.profiler.call('quiet', self.getQuietTicks, n_ticks)
+                    self.profiler.call('skip', self.skipTicks, quiet_ticks)
+                    self.profiler.count('skippedTicks', quiet_ticks)
+                if quiet_ticks:
+                    backoff = 0
+                else:
+                    backoff = min(2 * backoff or 1, MAX_PROBE_BACKOFF)
+                    ticks_to_probe = backoff
+            n_ticks -= quiet_ticks
+            if n_ticks > 0:
+                self.step()
+                n_ticks -= 1
+            if self.renderer is not None:
+                self.renderer.update(quiet_ticks + 1)
+            if self.checkTruncation(threshold):
+                return
+
+    def checkTruncation(self, threshold):
+        if threshold is not None and self.getFitnessUpperBound() < threshold:
+            self.truncated = True
+        return self.truncated
+
+    def getQuietTicks(self, limit):
+        # how many of the next ticks (at most limit) nothing happens in but cars driving on unhindered,
+        # blocked cars waiting where they are and the light timer running: no spawn, no light change or
+        # decision, no car reaching the crossroad, a turn, a stop line, its leader or the edge of the screen
+        if self.physicsTicks != 1:
+            return 0
+        if self.net is not None:
+            limit = min(limit, max(self.ticksToDecision, 0))
+        for road in self.roads:
+            for line in road.lines:
+                if limit == 0:
+                    return 0
+                limit = line.getQuietTicks(self, limit)
+        limit = self.getQuietLightTicks(limit)
+
+        if not self.outsideTraffic:
+            return limit
+        if self.arrivals is not None:
+            if self.nextArrival < len(self.arrivals):
+                return min(limit, self.arrivals[self.nextArrival][0] - self.tick)
+            return limit
+
+        # the spawn process is drawn ahead until its next spawn; isSpawnTick takes those draws before
+        # drawing new ones, so the random sequence is the same as when stepping tick by tick
+        quiet_ticks = 0
+        for is_spawn_tick in self.drawnSpawnTicks:
+            if is_spawn_tick or quiet_ticks == limit:
+                return quiet_ticks
+            quiet_ticks += 1
+        while quiet_ticks < limit:
+            is_spawn_tick = self.random.randint(1, int(FPS // self.spawnRate)) == 1
+            self.drawnSpawnTicks.append(is_spawn_tick)
+            if is_spawn_tick:
+                break
+            quiet_ticks += 1
+        return quiet_ticks
+
+    def getQuietLightTicks(self, limit):
+        is_yellow = self.trafficLightsState is self.layout.yellowState
+        timer = self.timer
+        for quiet_ticks in range(limit):
+            timer += self.physicsTicks / FPS
+            if (self.net is None and timer >= 10) or (is_yellow and timer >= YELLOW_TIME):
+                return quiet_ticks
+        return limit
+
+    def skipTicks(self, n_ticks):
+        # the quiet ticks found by getQuietTicks, done at once without looking at the cars around.
+        # Waiting times and full speed moves are added as n_ticks times a tick's share rather than tick by tick,
+        # which may differ from stepping in the last bits of a float (relative 1e-12 or so in the fitness).
+        # The light timer alone is still counted tick by tick: it is compared with fixed times, and 30 ticks of
+        # 1 / 60 s add up to 0.49999999999999994 s, so a yellow light lasts 31 ticks when stepping
+        if n_ticks == 0:
+            return
+        if self.outsideTraffic and self.arrivals is None:
+            for _ in range(n_ticks):
+                self.drawnSpawnTicks.popleft()
+        self.tick += n_ticks
+        waiting_cars = 0
+        for road in self.roads:
+            for line in road.lines:
+                for cars in (line.carsBeforeCrossroad, line.carsAfterCrossroad):
+                    for car in cars:
+                        waiting_cars += car.skipTicks(self, n_ticks)
+                for car in line.queue:
+                    car.wait(n_ticks)
+                waiting_cars += len(line.queue)
+                line.maxWaitingTime = max([car.waitingTime for car in line.carsBeforeCrossroad], default=0)
+
+        for _ in range(n_ticks):
+            self.timer += self.physicsTicks / FPS
+        self.sumWaitingTime += waiting_cars * n_ticks / 60
+        if self.net is not None:
+            self.ticksToDecision -= n_ticks
+        self.updateStatistics()
+
+    def getFitness(self):
+        return 100 - self.maxWaitingTime - self.averageTime / 2 - self.switchPenalty
+
+    def getEpisodeFitness(self, n_ticks, threshold=None):
+        # fitness of an episode of n_ticks run with threshold. The fitness of a truncated one so far is no score:
+        # a genome failing sooner has less averageTime and would rank higher. It is put below threshold instead,
+        # the lower the more of the episode was left, so genomes that fail sooner rank below those failing later
+        if not self.truncated:
+            return self.getFitness()
+        unplayed = max(n_ticks - self.tick, 0) / n_ticks
+        return min(self.getFitness(), threshold) - TRUNCATION_PENALTY * unplayed
+
+    def getFitnessUpperBound(self):
+        # maxWaitingTime and switchPenalty never decrease, averageTime is never negative
+        return 100 - self.maxWaitingTime - self.switchPenalty
+
+    def drawCars(self, screen):
+        for road in self.roads:
+            for line in road.lines:
+                for cars in (line.carsBeforeCrossroad, line.carsAfterCrossroad):
+                    for car in cars:
+                        car.draw(screen)
+
+    def display(self, screen):
+        import pygame as pg
+        screen_size = self.screenSize
+        pg.draw.rect(screen, (11, 218, 81), (0, 0, screen_size[0], screen_size[1]))
+
+        pg.draw.rect(screen, (68, 68, 71), (screen_size[0] // 2 - ROAD_WIDTH // 2, 0, ROAD_WIDTH, screen_size[1]))
+
+        y = 0
+        while y < screen_size[1]:
+            pg.draw.rect(screen, (255, 255, 255),
+                         (screen_size[0] // 2 - ROAD_WIDTH // 4 - BROKEN_LINE_WIDTH // 2, y, BROKEN_LINE_WIDTH,
+                          BROKEN_LINE_LENGTH))
+            pg.draw.rect(screen, (255, 255, 255),
+                         (screen_size[0] // 2 + ROAD_WIDTH // 4 - BROKEN_LINE_WIDTH // 2, y, BROKEN_LINE_WIDTH,
+                          BROKEN_LINE_LENGTH))
+
+            y += 2 * BROKEN_LINE_LENGTH
+
+        pg.draw.rect(screen, (68, 68, 71), (0, screen_size[1] // 2 - ROAD_WIDTH // 2, screen_size[0], ROAD_WIDTH))
+
+        x = 0
+        while x < screen_size[0]:
+            pg.draw.rect(screen, (255, 255, 255),
+                         (x, screen_size[1] // 2 - ROAD_WIDTH // 4 - BROKEN_LINE_WIDTH // 2, BROKEN_LINE_LENGTH,
+                          BROKEN_LINE_WIDTH))
+            pg.draw.rect(screen, (255, 255, 255),
+                         (x, screen_size[1] // 2 + ROAD_WIDTH // 4 - BROKEN_LINE_WIDTH // 2, BROKEN_LINE_LENGTH,
+                          BROKEN_LINE_WIDTH))
+            x += 2 * BROKEN_LINE_LENGTH
+
+        for road in self.roads:
+            for line in road.lines:
+                pg.draw.rect(screen, TRAFFIC_LIGHT_COLORS[line.trafficLightColor], line.trafficLightRect)
+
+        pg.draw.rect(screen, (255, 255, 255),
+                     (screen_size[0] // 2 - BROKEN_LINE_WIDTH // 2, 0, BROKEN_LINE_WIDTH, screen_size[1]))
+        pg.draw.rect(screen, (255, 255, 255),
+                     (0, screen_size[1] // 2 - BROKEN_LINE_WIDTH // 2, screen_size[0], BROKEN_LINE_WIDTH))
+        pg.draw.rect(screen, (68, 68, 71),
+                     (screen_size[0] // 2 - ROAD_WIDTH // 2, screen_size[1] // 2 - ROAD_WIDTH // 2,
+                      ROAD_WIDTH, ROAD_WIDTH))
+
+        for rect in self.layout.grass:
+            pg.draw.rect(screen, (11, 218, 81), rect)
+
+
+class Road:
+    __slots__ = ('lines', 'orientation', 'number')
+
+    def __init__(self, number, orientation):
+        # lines = [(number, coordinate, direction)]
+        self.lines = []
+        self.orientation = orientation
+        self.number = number
+
+
+class Line:
+    __slots__ = ('number', 'coordinate', 'direction', 'vertical', 'sign', 'spawnPoint', 'spawnDistance',
+                 'crossroadStart', 'crossroadEnd', 'queue', 'carsBeforeCrossroad', 'carsAfterCrossroad',
+                 'maxWaitingTime', 'trafficLightRect', 'trafficLightColor')
+
+    def __init__(self, number, coordinate, direction, screen_size, traffic_light_rect, crossroad_rect):
+        self.number = number
+        self.coordinate = coordinate
+        self.direction = direction
+        # the axis cars drive along and whether they drive up or down it, so Car.move needs no tuple lookups
+        self.vertical = direction[0] == 0
+        self.sign = direction[0] + direction[1]
+        self.spawnPoint = None
+        self.placeSpawnPoint(screen_size)
+        self.trafficLightRect = traffic_light_rect
+        self.spawnDistance = 0  # distToCrossroad of a car at the spawn point
+        self.crossroadStart = self.crossroadEnd = 0  # where a car on the line is on the crossroad, see isOnCrossroad
+        self.placeStopLine(crossroad_rect)
+        self.queue = deque()
+        # cars driving along the line, leading car first: those approaching the crossroad
+        # and those that have entered it, see insertAfterCrossroad
+        self.carsBeforeCrossroad = []
+        self.carsAfterCrossroad = []
+        self.maxWaitingTime = 0  # of the cars in carsBeforeCrossroad
+        self.trafficLightColor = 2
+
+    def placeSpawnPoint(self, screen_size):
+        if self.direction == (1, 0):
+            self.spawnPoint = (-2 * CIRCLE_RAD, self.coordinate)
+        elif self.direction == (-1, 0):
+            self.spawnPoint = (screen_size[0] + 2 * CIRCLE_RAD, self.coordinate)
+        elif self.direction == (0, 1):
+            self.spawnPoint = (self.coordinate, -2 * CIRCLE_RAD)
+        elif self.direction == (0, -1):
+            self.spawnPoint = (self.coordinate, screen_size[1] + 2 * CIRCLE_RAD)
+
+    def placeStopLine(self, crossroad_rect):
+        # cars keep their distance to the middle of the traffic light, and the coordinate across the line
+        # always lies within the crossroad, so only the coordinate along the line has to be compared
+        left, top, width, height = self.trafficLightRect
+        self.spawnDistance = distance(self.spawnPoint, (left + width // 2, top + height // 2))
+        left, top, width, height = crossroad_rect
+        if self.vertical:
+            self.crossroadStart, self.crossroadEnd = top - CIRCLE_RAD, top + height + CIRCLE_RAD
+        else:
+            self.crossroadStart, self.crossroadEnd = left - CIRCLE_RAD, left + width + CIRCLE_RAD
+
+    def spawnCar(self, crossroad):
+        if self.queue:
+            # the last approaching car is the one nearest to the spawn point
+            is_spawn_point_free = not self.carsBeforeCrossroad or \
+                self.carsBeforeCrossroad[-1].distToSpawnpoint >= 2 * CIRCLE_RAD + OPTIMAL_DISTANCE
+            if is_spawn_point_free:
+                car = self.queue.popleft()
+                car.x = self.spawnPoint[0]
+                car.y = self.spawnPoint[1]
+                car.distToCrossroad = self.spawnDistance
+                self.carsBeforeCrossroad.append(car)
+                if car.waitingTime > self.maxWaitingTime:
+                    self.maxWaitingTime = car.waitingTime
+                if car.waitingTime > crossroad.maxWaitingTime:
+                    crossroad.maxWaitingTime = car.waitingTime
+            else:
+                for car in self.queue:
+                    car.wait(crossroad.physicsTicks)
+                crossroad.waitingCars += len(self.queue) * crossroad.physicsTicks
+
+    def getQuietTicks(self, crossroad, limit):
+        for cars in (self.carsBeforeCrossroad, self.carsAfterCrossroad):
+            leader = None
+            for car in cars:
+                limit = min(limit, car.getQuietTicks(crossroad, leader, limit))
+                if limit <= 0:
+                    return 0
+                leader = car
+
+        if self.queue:
+            # queued cars must keep waiting for the spawn point
+            if not self.carsBeforeCrossroad:
+                return 0
+            last_car = self.carsBeforeCrossroad[-1]
+            gap = 2 * CIRCLE_RAD + OPTIMAL_DISTANCE - last_car.distToSpawnpoint
+            if gap <= 0:
+                return 0
+            if last_car.quietState != 'waiting':
+                limit = min(limit, int(gap // CAR_SPEED) - 1)
+        return max(limit, 0)
+
+    def getProgress(self, car):
+        return car.x * self.direction[0] + car.y * self.direction[1]
+
+    def insertAfterCrossroad(self, car):
+        # cars that entered the crossroad are ordered by how far they got along the line rather than
+        # by distToCrossroad, which stands still while a car is on the crossroad
+        progress = self.getProgress(car)
+        i = len(self.carsAfterCrossroad)
+        while i > 0 and self.getProgress(self.carsAfterCrossroad[i - 1]) < progress:
+            i -= 1
+        self.carsAfterCrossroad.insert(i, car)
+
+
+class Car:
+    __slots__ = ('id', 'x', 'y', 'waitingTime', 'speed', 'road', 'line', 'destinationRoad', 'destinationLine',
+                 'distToCrossroad', 'distToSpawnpoint', 'passed', 'quietState', 'quietSteps')
+
+    def __init__(self):
+        self.id = -1
+        self.x = 0
+        self.y = 0
+        self.waitingTime = 0
+        self.speed = CAR_SPEED
+        self.road = None
+        self.line = None
+        self.destinationRoad = None
+        self.destinationLine = None
+        self.distToCrossroad = float("inf")
+        self.distToSpawnpoint = 0
+        self.passed = False
+        self.quietState = None  # see getQuietTicks
+        self.quietSteps = (0, 0)
+
+    @property
+    def color(self):
+        # from green to red by 0.5 per waited tick, only worked out when the car is drawn
+        shift = self.waitingTime * 30
+        return min(shift, 255), max(255 - shift, 0), 0
+
+    def draw(self, screen):
+        import pygame as pg
+        pg.draw.circle(screen, self.color, (self.x, self.y), CIRCLE_RAD)
+
+    def isOnCrossroad(self, crossroad):
+        line = self.line
+        if line.crossroadStart < (self.y if line.vertical else self.x) < line.crossroadEnd:
+            self.passed = True
+            return True
+        else:
+            return False
+
+    def isOffScreen(self, crossroad):
+        return not -3 * CIRCLE_RAD < self.x < crossroad.screenSize[0] + 3 * CIRCLE_RAD or \
+            not -3 * CIRCLE_RAD < self.y < crossroad.screenSize[1] + 3 * CIRCLE_RAD
+
+    def wait(self, ticks=1):
+        self.waitingTime += ticks / 60
+
+    def update(self, crossroad, leader=None):
+        if self.road is not self.destinationRoad:
+            if self.line.vertical:
+                if abs(self.y - self.destinationLine.coordinate) < CAR_SPEED * crossroad.physicsTicks:
+                    self.y = self.destinationLine.coordinate
+                    self.road = self.destinationRoad
+                    self.line = self.destinationLine
+
+            else:
+                if abs(self.x - self.destinationLine.coordinate) < CAR_SPEED * crossroad.physicsTicks:
+                    self.x = self.destinationLine.coordinate
+                    self.road = self.destinationRoad
+                    self.line = self.destinationLine
+        self.move(crossroad, leader)
+
+    def move(self, crossroad, leader=None):
+        # leader is the car right in front on the same line and the same side of the crossroad
+        is_able_to_move = True
+        if not self.isOnCrossroad(crossroad) and leader is not None:
+            if not self.passed:
+                d = self.distToCrossroad - leader.distToCrossroad
+            else:
+                d = leader.distToCrossroad - self.distToCrossroad
+
+            if d < 2 * CIRCLE_RAD + OPTIMAL_DISTANCE:
+                is_able_to_move = False
+
+        if not self.passed and self.line.trafficLightColor != 0:
+            if self.distToCrossroad < CIRCLE_RAD + TRAFFIC_LIGHT_WIDTH // 2 + OPTIMAL_DISTANCE:
+                is_able_to_move = False
+        ticks = crossroad.physicsTicks
+        if is_able_to_move:
+            self.speed += CAR_SPEED / 50 * ticks
+            if self.speed > CAR_SPEED:
+                self.speed = CAR_SPEED
+        else:
+            self.speed -= CAR_SPEED / 2 * ticks
+            if self.speed < 0:
+                self.speed = 0
+
+            self.wait(ticks)
+            crossroad.waitingCars += ticks
+            if self.waitingTime > crossroad.maxWaitingTime:
+                crossroad.maxWaitingTime = self.waitingTime
+
+        delta = self.speed * ticks
+        if self.line.vertical:
+            self.y += delta * self.line.sign
+        else:
+            self.x += delta * self.line.sign
+        self.distToSpawnpoint += delta
+
+        if not self.passed:
+            self.distToCrossroad -= delta
+        elif self.passed and not self.isOnCrossroad(crossroad):
+            self.distToCrossroad += delta
+
+    def getQuietTicks(self, crossroad, leader, limit):
+        # ticks before the car could do anything but drive on unhindered or stand blocked, counted
+        # conservatively: a driving car is taken to cover anything from its current speed to CAR_SPEED
+        # per tick. quietState and quietSteps (the range of its advance per tick in distToCrossroad
+        # terms) are left for skipTicks and for the car behind
+        dx, dy = self.line.direction
+        progress = self.x * dx + self.y * dy
+        line = self.line
+        entry, leave = sorted((line.crossroadStart * line.sign, line.crossroadEnd * line.sign))
+        if dx:
+            screen_edge = crossroad.screenSize[0] + 3 * CIRCLE_RAD if dx > 0 else 3 * CIRCLE_RAD
+        else:
+            screen_edge = crossroad.screenSize[1] + 3 * CIRCLE_RAD if dy > 0 else 3 * CIRCLE_RAD
+        on_crossroad = entry < progress < leave
+        if on_crossroad and not self.passed:
+            return 0
+        headway = 2 * CIRCLE_RAD + OPTIMAL_DISTANCE
+        stop_distance = CIRCLE_RAD + TRAFFIC_LIGHT_WIDTH // 2 + OPTIMAL_DISTANCE
+        # gap to the leader as seen by the car, the leader having moved already in the same tick
+        gap = None
+        if leader is not None and not on_crossroad:
+            gap = self.distToCrossroad - leader.distToCrossroad
+            if self.passed:
+                gap = -gap
+
+        if self.speed == 0:
+            self.quietState = 'waiting'
+            self.quietSteps = (0, 0)
+            if not self.passed and self.line.trafficLightColor != 0 and self.distToCrossroad < stop_distance:
+                return limit
+            if gap is not None and gap + leader.quietSteps[1] < headway:
+                # blocked as long as the gap, growing by at most the leader's top step, stays short
+                if leader.quietSteps[1] > 0:
+                    limit = min(limit, int((headway - gap) // leader.quietSteps[1]) - 1)
+                return limit
+
+        if self.passed:
+            self.quietState = 'crossing' if on_crossroad else 'leaving'
+        else:
+            self.quietState = 'approaching'
+        self.quietSteps = (0, 0) if on_crossroad else (self.speed, CAR_SPEED)
+        limit = min(limit, int((screen_edge - progress) // CAR_SPEED) - 1)
+        if not self.passed:
+            limit = min(limit, int((entry - progress) // CAR_SPEED) - 1)
+        elif on_crossroad:
+            limit = min(limit, int((leave - progress) // CAR_SPEED) - 1)
+        if self.road != self.destinationRoad:
+            to_turn = self.destinationLine.coordinate * (dx + dy) - progress
+            if abs(to_turn) < CAR_SPEED:
+                return 0
+            if to_turn > 0:
+                limit = min(limit, int(to_turn // CAR_SPEED) - 1)
+        if not self.passed and self.line.trafficLightColor != 0:
+            limit = min(limit, int((self.distToCrossroad - stop_distance) // CAR_SPEED) - 1)
+        if gap is not None:
+            # in the j-th tick the gap is at least a + b * j
+            a = gap + self.quietSteps[1]
+            b = leader.quietSteps[0] - self.quietSteps[1]
+            if a + b < headway:
+                return 0
+            if b < 0:
+                limit = min(limit, int((a - headway) // -b) - 1)
+        return limit
+
+    def skipTicks(self, crossroad, n_ticks):
+        # n_ticks of what getQuietTicks found the car doing, computed as move would;
+        # returns the number of cars waiting per tick
+        if self.quietState == 'waiting':
+            self.wait(n_ticks)
+            if self.waitingTime > crossroad.maxWaitingTime:
+                crossroad.maxWaitingTime = self.waitingTime
+            return 1
+
+        dx, dy = self.line.direction
+        # accelerating ticks one by one, at most 50 of them, then the rest at full speed at once
+        while n_ticks > 0 and self.speed < CAR_SPEED:
+            n_ticks -= 1
+            self.speed += CAR_SPEED / 50
+            if self.speed > CAR_SPEED:
+                self.speed = CAR_SPEED
+            self.x += self.speed * dx * 1
+            self.y += self.speed * dy * 1
+            delta = abs(self.speed * dx * 1) + abs(self.speed * dy * 1)
+            self.distToSpawnpoint += delta
+            if self.quietState == 'approaching':
+                self.distToCrossroad -= delta
+            elif self.quietState == 'leaving':
+                self.distToCrossroad += delta
+        if n_ticks > 0:
+            self.x += CAR_SPEED * dx * n_ticks
+            self.y += CAR_SPEED * dy * n_ticks
+            self.distToSpawnpoint += CAR_SPEED * n_ticks
+            if self.quietState == 'approaching':
+                self.distToCrossroad -= CAR_SPEED * n_ticks
+            elif self.quietState == 'leaving':
+                self.distToCrossroad += CAR_SPEED * n_ticks
+        return 0
+
+
+class ArrayCrossroad(ArrayCrossroadMixin, Crossroad):
+    # the same crossroad with its cars kept in NumPy arrays, see array_simulation
+    pass
+
+
+def main(genomes, config, crossroad_class, managed=True):
+    # shows the crossroad of crossroad_class with its lights driven by the first genome, or by the fixed cycle
+    import pygame as pg
+    import neat
+    from rendering import Renderer
+
+    crossroads = []
+    for genome_id, genome in genomes:
+        net = neat.nn.FeedForwardNetwork.create(genome, config)
+        crossroads.append(crossroad_class(net if managed else None))
+        genome.fitness = 0
+
+    crossroad = crossroads[0]
+    renderer = Renderer()
+    renderer.attach(crossroad)
+
+    clock = pg.time.Clock()
+    while True:
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                pg.quit()
+                exit()
+            elif event.type == pg.KEYDOWN:
+                if event.key == pg.K_SPACE:
+                    crossroad.isSwitched = not crossroad.isSwitched
+        crossroad.step()
+        renderer.draw()
+        pg.display.update()
+        clock.tick(60)
+
+
+def load_genome(genome_path, config_path):
+    # a pickled genome and the neat config it was trained with
+    import neat
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet,
+                                neat.DefaultStagnation, config_path)
+
+    with open(genome_path, "rb") as f:
+        genome = pickle.load(f)
+    return genome, config
+
+
+def load_network(genome_path="traffic_manager_AI.pkl", config_path="config.txt"):
+    import neat
+    genome, config = load_genome(genome_path, config_path)
+    return neat.nn.FeedForwardNetwork.create(genome, config)
+
+
+def replay_genome(config_path, genome_path, crossroad_class, managed=True):
+    genome, config = load_genome(genome_path, config_path)
+    genomes = [(1, genome)]
+    main(genomes, config, crossroad_class, managed)
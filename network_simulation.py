@@ -0,0 +1,203 @@
+import argparse
+import multiprocessing
+import time
+
+from evaluation import LAYOUTS, get_crossroad_class
+from intersection import load_network
+
+
+def neighbour(cell, direction):
+    # the cell a car driving in direction reaches next, rows grow downwards like screen coordinates
+    return cell[0] + direction[1], cell[1] + direction[0]
+
+
+class NetworkShard:
+    # the junctions of some cells of a CrossroadNetwork, all stepped in this process.
+    # A car leaving a junction towards another cell of the grid is handed off to that junction as
+    # (target cell, source cell, road, line) and joins the queue of the same line there one step later.
+    # Hand-offs between cells of this shard stay here, only those into other shards are returned by step
+    def __init__(self, crossroad_class, cells, grid_size, nets, seeds, decision_interval=None, physics_ticks=1):
+        self.gridSize = grid_size
+        self.crossroads = {}
+        for cell, net, seed in zip(cells, nets, seeds):
+            crossroad = crossroad_class(net, seed, decision_interval, physics_ticks)
+            # cars only come from outside of the grid on the lines no other junction feeds, each of them
+            # as many as on a single junction, so the spawn rate shrinks with the lines left
+            origins = crossroad.origins
+            crossroad.origins = [(road, line) for road, line in origins
+                                 if not self.isInGrid(neighbour(cell, (-line.direction[0], -line.direction[1])))]
+            crossroad.spawnRate = crossroad.spawnRate * len(crossroad.origins) / len(origins)
+            crossroad.outsideTraffic = bool(crossroad.origins)
+            crossroad.exits = []
+            self.crossroads[cell] = crossroad
+        self.lineNumbers = {line: (road.number, line.number) for crossroad in self.crossroads.values()
+                            for road in crossroad.roads for line in road.lines}
+        self.pending = []  # hand-offs between the junctions of this shard for the next step
+        self.outgoing = []
+
+    def isInGrid(self, cell):
+        return 0 <= cell[0] < self.gridSize[0] and 0 <= cell[1] < self.gridSize[1]
+
+    def enter(self, crossroad, road_number, line_number):
+        # a handed off car picks where it is headed at the junction it enters, like a car from outside
+        road, line = crossroad.getRoadLine(road_number, line_number)
+        if line not in crossroad.directions:
+            return  # no car may start on this line of the layout, so the car leaves the grid here
+        destination_road, destination_line = crossroad.random.choice(crossroad.directions[line])
+        crossroad.addCar((road_number, line_number, destination_road.number, destination_line.number))
+
+    def step(self, arrivals):
+        # hand-offs are entered ordered by target and source cell, so the outcome does not depend on the sharding
+        for target, source, road_number, line_number in sorted(self.pending + arrivals, key=lambda h: h[:2]):
+            self.enter(self.crossroads[target], road_number, line_number)
+        self.pending = []
+        outgoing = []
+        for cell, crossroad in self.crossroads.items():
+            crossroad.step()
+            for line in crossroad.exits:
+                target = neighbour(cell, line.direction)
+                if target in self.crossroads:
+                    self.pending.append((target, cell) + self.lineNumbers[line])
+                elif self.isInGrid(target):
+                    outgoing.append((target, cell) + self.lineNumbers[line])
+            crossroad.exits.clear()
+        return outgoing
+
+    def send(self, arrivals):
+        self.outgoing = self.step(arrivals)
+
+    def receive(self):
+        return self.outgoing
+
+    def getFitness(self):
+        return {cell: crossroad.getFitness() for cell, crossroad in self.crossroads.items()}
+
+    def close(self):
+        pass
+
+
+def run_shard(connection, args):
+    # worker process loop of a ShardProcess
+    shard = NetworkShard(*args)
+    while True:
+        command, payload = connection.recv()
+        if command == 'step':
+            connection.send(shard.step(payload))
+        elif command == 'fitness':
+            connection.send(shard.getFitness())
+        else:
+            break
+    connection.close()
+
+
+class ShardProcess:
+    # a NetworkShard stepped in its own process, only hand-offs between shards cross the pipe
+    def __init__(self, *args):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run_shard, args=(child_connection, args), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def send(self, arrivals):
+        self.connection.send(('step', arrivals))
+
+    def receive(self):
+        return self.connection.recv()
+
+    def getFitness(self):
+        self.connection.send(('fitness', None))
+        return self.connection.recv()
+
+    def close(self):
+        if self.process is not None:
+            self.connection.send(('close', None))
+            self.process.join()
+            self.connection.close()
+            self.process = None
+
+
+class CrossroadNetwork:
+    # a rows x columns grid of junctions of one layout (a corridor with rows=1) whose exits feed the spawn
+    # queues of the adjacent junctions. Every junction is driven by its own network when nets is a list
+    # (one per cell, row by row), by a network shared by all of them, or by the fixed cycle when nets is None.
+    # The grid is cut into num_shards stripes of rows, stepped in separate processes when processes is set;
+    # all shards are stepped once per step, then the cars crossing between shards are handed over
+    def __init__(self, crossroad_class, rows, columns, nets=None, seed=None, decision_interval=None, physics_ticks=1,
+                 num_shards=1, processes=False):
+        cells = [(row, column) for row in range(rows) for column in range(columns)]
+        if not isinstance(nets, (list, tuple)):
+            nets = [nets] * len(cells)
+        seeds = [None if seed is None else seed * len(cells) + i for i in range(len(cells))]
+        self.rows = rows
+        self.columns = columns
+        self.physicsTicks = physics_ticks
+        self.ticks = 0
+        self.shards = []
+        self.shardOf = {}
+        num_shards = max(min(num_shards, rows), 1)
+        for i in range(num_shards):
+            first, last = rows * i // num_shards, rows * (i + 1) // num_shards
+            indices = range(first * columns, last * columns)
+            args = (crossroad_class, [cells[j] for j in indices], (rows, columns), [nets[j] for j in indices],
+                    [seeds[j] for j in indices], decision_interval, physics_ticks)
+            self.shards.append(ShardProcess(*args) if processes else NetworkShard(*args))
+            for j in indices:
+                self.shardOf[cells[j]] = i
+        self.incoming = [[] for shard in self.shards]
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        for shard in getattr(self, 'shards', ()):
+            shard.close()
+
+    def step(self):
+        for shard, arrivals in zip(self.shards, self.incoming):
+            shard.send(arrivals)
+        self.incoming = [[] for shard in self.shards]
+        for shard in self.shards:
+            for handoff in shard.receive():
+                self.incoming[self.shardOf[handoff[0]]].append(handoff)
+        self.ticks += self.physicsTicks
+
+    def run(self, n_ticks):
+        for _ in range(n_ticks // self.physicsTicks):
+            self.step()
+
+    def getFitnesses(self):
+        # fitness of every junction, row by row
+        fitnesses = {}
+        for shard in self.shards:
+            fitnesses.update(shard.getFitness())
+        return [fitnesses[cell] for cell in sorted(fitnesses)]
+
+    def getFitness(self):
+        fitnesses = self.getFitnesses()
+        return sum(fitnesses) / len(fitnesses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate a grid of crossroads handing cars to each other.")
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='ordinary')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--genome', default=None, help="genome shared by every junction, the fixed cycle if not given")
+    parser.add_argument('--config', default="config.txt")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=60, help="simulated seconds")
+    parser.add_argument('--vectorised', action='store_true', help="keep cars in NumPy arrays, see array_simulation")
+    parser.add_argument('--shards', type=int, default=1, help="stripes of rows the grid is cut into")
+    parser.add_argument('--processes', action='store_true', help="step every shard in its own process")
+    args = parser.parse_args()
+
+    net = load_network(args.genome, args.config) if args.genome is not None else None
+    network = CrossroadNetwork(get_crossroad_class(args.layout, args.vectorised), args.rows, args.columns, net,
+                               args.seed, num_shards=args.shards, processes=args.processes)
+    start = time.perf_counter()
+    network.run(int(args.seconds * LAYOUTS[args.layout].FPS))
+    elapsed = time.perf_counter() - start
+    fitnesses = network.getFitnesses()
+    network.close()
+    print(f"{args.rows}x{args.columns} {args.layout}: mean fitness {sum(fitnesses) / len(fitnesses):.2f}, "
+          f"worst {min(fitnesses):.2f}, {network.ticks / elapsed:.0f} ticks/s")
@@ -0,0 +1,83 @@
+import json
+import marshal
+import time
+
+active = None  # profiler new crossroads and batches record into, see enable
+
+
+class PhaseProfiler:
+    # wall time and calls per phase of the simulation loop, plus counters such as the number of car moves.
+    # Crossroads only time their phases while they hold a profiler, otherwise step costs a single check
+    def __init__(self):
+        self.phases = {}  # name -> [calls, seconds]
+        self.counts = {}
+
+    def call(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [1, elapsed]
+        else:
+            phase[0] += 1
+            phase[1] += elapsed
+        return result
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def getState(self):
+        return {'phases': {name: {'calls': calls, 'seconds': seconds}
+                           for name, (calls, seconds) in self.phases.items()},
+                'counts': dict(self.counts)}
+
+    def merge(self, state):
+        # adds up the getState of another profiler, e.g. one of a worker process
+        for name, phase in state['phases'].items():
+            calls, seconds = self.phases.get(name, (0, 0.0))
+            self.phases[name] = [calls + phase['calls'], seconds + phase['seconds']]
+        for name, n in state['counts'].items():
+            self.count(name, n)
+
+    def save(self, path):
+        # pstats' format for a .prof or .pstats file, JSON otherwise
+        if path.endswith(('.prof', '.pstats')):
+            self.savePstats(path)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.getState(), f, indent=2)
+
+    def savePstats(self, path):
+        # every phase as a function of its own, which pstats.Stats and snakeviz can load
+        stats = {('simulation', 0, name): (calls, calls, seconds, seconds, {})
+                 for name, (calls, seconds) in self.phases.items()}
+        with open(path, "wb") as f:
+            marshal.dump(stats, f)
+
+    def report(self):
+        total = sum(seconds for calls, seconds in self.phases.values()) or 1
+        lines = [f"{name:12} {calls:9} calls {seconds:9.3f} s {100 * seconds / total:5.1f} %"
+                 for name, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1])]
+        lines += [f"{name:12} {n:9}" for name, n in sorted(self.counts.items())]
+        return '\n'.join(lines)
+
+
+def enable():
+    global active
+    active = PhaseProfiler()
+    return active
+
+
+def disable():
+    global active
+    active = None
+
+
+def run_profiled(function, *args):
+    # runs function with a fresh profiler active, for worker processes: returns its result and the profile
+    profiler = enable()
+    try:
+        return function(*args), profiler.getState()
+    finally:
+        disable()
@@ -0,0 +1,86 @@
+import time
+import pygame as pg
+
+WHITE = (255, 255, 255)
+
+
+class Renderer:
+    # draws a crossroad into a window while something else steps it, e.g. Crossroad.run in a training evaluation.
+    # A frame is drawn at most every `every` ticks and at most `fps` times per wall clock second, so a
+    # fast-forwarded run only slows down by the frames actually shown. Roads, markings and lights only change
+    # when the lights switch, so their picture is drawn once per combination of light colours and then blitted
+    def __init__(self, every=None, fps=None):
+        self.every = every
+        self.fps = fps
+        self.crossroad = None
+        self.screen = None
+        self.font = None
+        self.frames = {}  # light colours -> static picture of the crossroad
+        self.ticksSinceFrame = 0
+        self.lastFrameTime = 0
+        self.startTime = time.time()
+
+    def attach(self, crossroad, screen=None):
+        # opens a window of the crossroad's size unless a screen to draw on is given
+        pg.init()
+        if screen is None:
+            pg.display.set_caption("Traffic Manager")
+            screen = pg.display.set_mode(crossroad.screenSize)
+        self.screen = screen
+        self.font = pg.font.Font(None, 32)
+        self.crossroad = crossroad
+        crossroad.renderer = self
+        self.startTime = time.time()
+
+    def close(self):
+        # the crossroad goes on headless
+        if self.crossroad is not None:
+            self.crossroad.renderer = None
+            self.crossroad = None
+            self.frames = {}
+            pg.display.quit()
+
+    def update(self, ticks=1):
+        # called by the run loop after every step with the ticks it simulated
+        if self.crossroad is None:
+            return
+        self.ticksSinceFrame += ticks
+        if self.every is not None and self.ticksSinceFrame < self.every:
+            return
+        if self.fps is not None:
+            now = time.perf_counter()
+            if now - self.lastFrameTime < 1 / self.fps:
+                return
+            self.lastFrameTime = now
+        self.ticksSinceFrame = 0
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                self.close()
+                return
+        self.draw()
+        pg.display.update()
+
+    def getBackground(self):
+        crossroad = self.crossroad
+        colors = tuple(line.trafficLightColor for road in crossroad.roads for line in road.lines)
+        background = self.frames.get(colors)
+        if background is None:
+            background = pg.Surface(crossroad.screenSize).convert()
+            crossroad.display(background)
+            self.frames[colors] = background
+        return background
+
+    def draw(self):
+        crossroad = self.crossroad
+        self.screen.blit(self.getBackground(), (0, 0))
+        crossroad.drawCars(self.screen)
+
+        av_time = self.font.render(f'Average waiting time: {round(crossroad.averageTime, 2)} s', True, WHITE)
+        max_time = self.font.render(f'Max waiting time: {round(crossroad.maxWaitingTime, 2)} s', True, WHITE)
+        fitness = self.font.render(f'fitness: {round(crossroad.getFitness(), 2)}', True, WHITE)
+        timer = self.font.render(f'{round(time.time() - self.startTime, 2)} s', True, WHITE)
+
+        self.screen.blit(av_time, [10, 10])
+        self.screen.blit(max_time, [10, 40])
+        self.screen.blit(fitness, [10, 70])
+        self.screen.blit(timer, [crossroad.screenSize[0] - 120, 10])
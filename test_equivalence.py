@@ -0,0 +1,145 @@
+import os
+import random
+
+import neat
+import numpy as np
+import pytest
+
+from batch_simulation import CrossroadBatch
+from compiled_network import CompiledNetwork
+from evaluation import eval_genome
+from network_simulation import CrossroadNetwork
+import ordinary_intersection_simulation
+import tshaped_intersection_simulation
+from traffic_schedule import generate_schedule
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.txt')
+
+
+def load_config():
+    return neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet,
+                              neat.DefaultStagnation, CONFIG_PATH)
+
+
+def make_genomes(config, count, seed, mutations=10):
+    # genomes of a fresh population, mutated a few times so they differ in shape and aggregation
+    random.seed(seed)
+    genomes = list(neat.Population(config).population.values())[:count]
+    for genome in genomes:
+        for _ in range(mutations):
+            genome.mutate(config.genome_config)
+    return genomes
+
+
+def make_networks(config, count, seed):
+    return [neat.nn.FeedForwardNetwork.create(genome, config) for genome in make_genomes(config, count, seed)]
+
+
+def test_compiled_network_matches_activate():
+    config = load_config()
+    nets = make_networks(config, 8, seed=1)
+    rng = np.random.default_rng(1)
+    inputs = rng.normal(0, 10, (20, len(nets), len(nets[0].input_nodes)))
+    # empty lines report an infinite distance to the crossroad
+    inputs[rng.random(inputs.shape) < 0.2] = float('inf')
+    outputs = CompiledNetwork(nets).activateBatch(inputs)
+    expected = np.array([[net.activate(list(row)) for net, row in zip(nets, rows)] for rows in inputs])
+    # np.tanh and math.tanh may differ in the last bit, but never in the sign the lights are switched on
+    np.testing.assert_allclose(outputs, expected, rtol=1e-12, atol=1e-15)
+    np.testing.assert_array_equal(outputs > 0, expected > 0)
+
+
+@pytest.mark.parametrize('simulation', [ordinary_intersection_simulation, tshaped_intersection_simulation])
+def test_compiled_batch_matches_activate(simulation):
+    nets = make_networks(load_config(), 8, seed=5)
+    fitnesses = []
+    for compiled in (False, True):
+        batch = CrossroadBatch.fromNets(simulation.Crossroad, nets, list(range(8)), compiled)
+        batch.run(1800)
+        fitnesses.append(batch.getFitness())
+    assert fitnesses[1] == fitnesses[0]
+
+
+def crossroad_state(crossroad):
+    # (what has to match exactly, the floats)
+    cars = [car for road in crossroad.roads for line in road.lines
+            for cars in (line.queue, line.carsBeforeCrossroad, line.carsAfterCrossroad) for car in cars]
+    exact = [crossroad.processedCars, crossroad.trafficLightsState, crossroad.random.random()]
+    exact += [(car.id, car.passed) for car in cars]
+    floats = [crossroad.getFitness(), crossroad.sumWaitingTime, crossroad.maxWaitingTime, crossroad.timer]
+    floats += [value for car in cars for value in (car.x, car.y, car.speed, car.distToCrossroad, car.waitingTime)]
+    return exact, floats
+
+
+@pytest.mark.parametrize('simulation', [ordinary_intersection_simulation, tshaped_intersection_simulation])
+@pytest.mark.parametrize('spawn_rate', [0.5, 5])
+@pytest.mark.parametrize('managed', [False, True])
+def test_event_driven_matches_stepping(simulation, spawn_rate, managed):
+    # skipped ticks are added up at once, so the results only agree up to float rounding
+    config = load_config()
+    states = []
+    for event_driven in (False, True):
+        net = make_networks(config, 1, seed=2)[0] if managed else None
+        crossroad = simulation.Crossroad(net, 3, 0.5 if managed else None, 1, event_driven)
+        crossroad.spawnRate = spawn_rate
+        crossroad.run(3000)
+        states.append(crossroad_state(crossroad))
+    (stepped_exact, stepped_floats), (skipped_exact, skipped_floats) = states
+    assert skipped_exact == stepped_exact
+    assert skipped_floats == pytest.approx(stepped_floats, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize('simulation', [ordinary_intersection_simulation, tshaped_intersection_simulation])
+@pytest.mark.parametrize('spawn_rate', [2, 20])
+@pytest.mark.parametrize('managed', [False, True])
+def test_array_crossroad_matches_crossroad(simulation, spawn_rate, managed):
+    # every crossroad of a batch of ArrayCrossroads, whose cars are moved together, on its own traffic
+    nets = make_networks(load_config(), 2, seed=4) if managed else [None] * 2
+    schedules = [generate_schedule(simulation, seed, 2400, spawn_rate) for seed in range(2)]
+    batch = CrossroadBatch([simulation.ArrayCrossroad(net, None, 0.5, 1, False, schedule)
+                            for net, schedule in zip(nets, schedules)])
+    batch.run(2400)
+    for net, schedule, array_crossroad in zip(nets, schedules, batch.crossroads):
+        crossroad = simulation.Crossroad(net, None, 0.5, 1, False, schedule)
+        crossroad.run(2400)
+        states = [[c.getFitness(), c.processedCars, c.carsOnRoads, c.sumWaitingTime, c.maxWaitingTime,
+                   c.sumWaitingTimeOfProcessedCars] for c in (crossroad, array_crossroad)]
+        assert states[1] == pytest.approx(states[0], rel=1e-9)
+
+
+def test_event_driven_rejects_per_tick_decisions():
+    net = make_networks(load_config(), 1, seed=2)[0]
+    with pytest.raises(ValueError):
+        ordinary_intersection_simulation.Crossroad(net, 3, None, 1, True)
+
+
+@pytest.mark.parametrize('managed', [False, True])
+def test_network_does_not_depend_on_sharding(managed):
+    net = make_networks(load_config(), 1, seed=3)[0] if managed else None
+    fitnesses = []
+    for num_shards, processes in ((1, False), (3, False), (3, True)):
+        network = CrossroadNetwork(ordinary_intersection_simulation.Crossroad, 4, 3, net, 7, num_shards=num_shards,
+                                   processes=processes)
+        network.run(600)
+        fitnesses.append(network.getFitnesses())
+        network.close()
+    assert fitnesses[1] == fitnesses[0]
+    assert fitnesses[2] == fitnesses[0]
+
+
+def test_truncation_keeps_the_order_of_full_episodes():
+    # a prefix of an episode cannot tell every pair of genomes apart, but most of the truncated genomes have to
+    # rank as their full episodes would, where their fitness so far ranked them mostly the other way round
+    config = load_config()
+    genomes = make_genomes(config, 15, seed=2, mutations=0)
+    schedule = generate_schedule(tshaped_intersection_simulation, 4, 30 * tshaped_intersection_simulation.FPS)
+    pairs = []
+    for genome in genomes:
+        full = eval_genome(genome, config, 'tshaped', 30, schedule=schedule)
+        score, truncated = eval_genome(genome, config, 'tshaped', 30, schedule=schedule, threshold=40)
+        if truncated:
+            assert score < 40
+            pairs.append((full, score))
+    ordered = [a[1] < b[1] for a in pairs for b in pairs if a[0] < b[0]]
+    assert len(pairs) >= 10
+    assert sum(ordered) >= 0.75 * len(ordered)
@@ -0,0 +1,47 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# one row per car: the tick it is queued in and its route as road and line numbers
+ARRIVAL_DTYPE = np.dtype([('tick', np.int64), ('road', np.int64), ('line', np.int64),
+                          ('destinationRoad', np.int64), ('destinationLine', np.int64)])
+
+
+def generate_schedule(simulation, seed=None, n_ticks=None, spawn_rate=None, road_weights=None):
+    # the arrivals Crossroad.addCar would produce over n_ticks, drawn all at once from the route table
+    # of the layout so every genome handed the same schedule meets exactly the same traffic.
+    # road_weights ({road number: factor}) makes cars start on some roads more often than the layout does
+    if n_ticks is None:
+        n_ticks = 100 * simulation.FPS
+    if spawn_rate is None:
+        spawn_rate = simulation.SPAWNRATE
+    rng = np.random.default_rng(seed)
+    # a car arrives in a tick with probability spawn_rate / FPS, as in Crossroad.isSpawnTick
+    ticks = np.flatnonzero(rng.integers(simulation.FPS // spawn_rate, size=n_ticks) == 0)
+
+    routes, weights = simulation.Crossroad().getRouteTable()
+    routes = np.array(routes, np.int64)
+    weights = np.array(weights, np.float64)
+    if road_weights:
+        weights *= [road_weights.get(route[0], 1) for route in routes.tolist()]
+    picked = routes[rng.choice(len(routes), size=len(ticks), p=weights / weights.sum())]
+
+    schedule = np.zeros(len(ticks), ARRIVAL_DTYPE)
+    schedule['tick'] = ticks
+    for i, name in enumerate(ARRIVAL_DTYPE.names[1:]):
+        schedule[name] = picked[:, i]
+    return schedule
+
+
+def share_schedule(schedule):
+    # a copy of schedule in shared memory, which worker processes map with attach_schedule instead of
+    # each receiving a pickled copy; the creator closes and unlinks it once the workers are done
+    shared = shared_memory.SharedMemory(create=True, size=max(schedule.nbytes, 1))
+    np.ndarray(len(schedule), ARRIVAL_DTYPE, shared.buf)[:] = schedule
+    return shared
+
+
+def attach_schedule(name, length):
+    # (shared memory, schedule read from it) of a share_schedule block; the array is only valid
+    # as long as the shared memory object is kept
+    shared = shared_memory.SharedMemory(name)
+    return shared, np.ndarray(length, ARRIVAL_DTYPE, shared.buf)
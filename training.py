@@ -0,0 +1,140 @@
+import argparse
+import glob
+import os
+import pickle
+import neat
+
+from evaluation import AGGREGATES, EPISODE_TIME, LAYOUTS, PopulationEvaluator
+from fitness_cache import FitnessCache
+
+CHECKPOINT_PREFIX = 'neat-checkpoint-'
+CACHE_PATH = 'fitness_cache.pkl'
+GENOME_PATH = 'best_genome.pkl'  # kept apart from the pretrained traffic_manager_AI.pkl the replays load
+
+
+class BestGenomeSaver(neat.reporting.BaseReporter):
+    # keeps the best genome seen so far on disk so a preempted run never loses it. A resumed run starts
+    # from the fitness of the genome already saved, so only a better one replaces it
+    def __init__(self, genome_path, resume=False):
+        self.genomePath = genome_path
+        self.bestFitness = None
+        if resume and os.path.exists(genome_path):
+            with open(genome_path, "rb") as f:
+                self.bestFitness = pickle.load(f).fitness
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self.bestFitness is None or best_genome.fitness > self.bestFitness:
+            self.bestFitness = best_genome.fitness
+            with open(self.genomePath, "wb") as f:
+                pickle.dump(best_genome, f)
+
+
+def parse_scenario(text):
+    # layout:spawn rate[:imbalance], e.g. ordinary:10:2 for twice as many cars starting on road 1
+    parts = text.split(':')
+    if len(parts) not in (2, 3) or parts[0] not in LAYOUTS:
+        raise argparse.ArgumentTypeError(f"Expected layout:spawn_rate[:imbalance], got {text}")
+    return parts[0], int(parts[1]), float(parts[2]) if len(parts) == 3 else 1
+
+
+def find_latest_checkpoint(checkpoint_prefix=CHECKPOINT_PREFIX):
+    checkpoints = [path for path in glob.glob(checkpoint_prefix + '*')
+                   if path[len(checkpoint_prefix):].isdigit()]
+    if not checkpoints:
+        return None
+    return max(checkpoints, key=lambda path: int(path[len(checkpoint_prefix):]))
+
+
+def train(config_path, generations=100, checkpoint_interval=5, checkpoint_prefix=CHECKPOINT_PREFIX,
+          resume=None, genome_path=GENOME_PATH, layout='tshaped', num_workers=None,
+          episode_time=EPISODE_TIME, batch_size=1, vectorised=False, decision_interval=None, physics_ticks=1,
+          event_driven=False, schedule_seed=None, cache_size=None, cache_path=None, truncate_below=None,
+          truncate_rank=None, profile_path=None, watch=None, scenarios=None, num_seeds=1, aggregate='mean'):
+    if resume == 'latest':
+        resume = find_latest_checkpoint(checkpoint_prefix)
+
+    if resume is not None:
+        print(f'Resuming from {resume}')
+        population = neat.Checkpointer.restore_checkpoint(resume)
+        # checkpoints hold the offspring of the generation in their name, which is the next one to evaluate
+        population.generation += 1
+    else:
+        config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet,
+                                    neat.DefaultStagnation, config_path)
+        population = neat.Population(config)
+
+    population.add_reporter(neat.StdOutReporter(True))
+    population.add_reporter(neat.Checkpointer(checkpoint_interval, None, checkpoint_prefix))
+    population.add_reporter(BestGenomeSaver(genome_path, resume is not None))
+
+    # `generations` is the total length of the run, so a resumed run stops where the original one would have
+    remaining = max(generations - population.generation, 0)
+    cache = None
+    if cache_size or cache_path:
+        cache = FitnessCache(cache_size or 10000, cache_path)
+    evaluator = PopulationEvaluator(num_workers=num_workers, layout=layout, episode_time=episode_time,
+                                    batch_size=batch_size, vectorised=vectorised,
+                                    decision_interval=decision_interval, physics_ticks=physics_ticks,
+                                    event_driven=event_driven, schedule_seed=schedule_seed, cache=cache,
+                                    truncate_below=truncate_below, truncate_rank=truncate_rank,
+                                    profile=profile_path is not None, watch=watch, scenarios=scenarios,
+                                    num_seeds=num_seeds, aggregate=aggregate)
+    try:
+        winner = population.run(evaluator.evaluate, remaining)
+    finally:
+        evaluator.close()
+        if evaluator.profiler is not None:
+            print(evaluator.profiler.report())
+            evaluator.profiler.save(profile_path)
+    # the best genome is on disk already, BestGenomeSaver wrote it when it was found
+    return winner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evolve a traffic light controller with NEAT.")
+    parser.add_argument('--config', default="config.txt")
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--checkpoint-interval', type=int, default=5)
+    parser.add_argument('--checkpoint-prefix', default=CHECKPOINT_PREFIX)
+    parser.add_argument('--resume', default=None, help="checkpoint file to resume from, or 'latest'")
+    parser.add_argument('--genome', default=GENOME_PATH, help="where to pickle the best genome")
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='tshaped')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--episode-time', type=float, default=EPISODE_TIME, help="simulated seconds per episode")
+    parser.add_argument('--batch-size', type=int, default=1, help="genomes simulated in lockstep per worker task")
+    parser.add_argument('--vectorised', action='store_true',
+                        help="keep the cars of each batch of crossroads in NumPy arrays, see array_simulation")
+    parser.add_argument('--decision-interval', type=float, default=None,
+                        help="simulated seconds between controller decisions, every tick by default")
+    parser.add_argument('--physics-ticks', type=int, default=1, help="1 / 60 s ticks simulated per physics step")
+    parser.add_argument('--event-driven', action='store_true',
+                        help="skip the ticks in which cars only drive on or stand still, needs --decision-interval")
+    parser.add_argument('--schedule-seed', type=int, default=None,
+                        help="evaluate every genome against the same arrivals generated from this seed")
+    parser.add_argument('--cache-size', type=int, default=None,
+                        help="fitnesses kept to skip re-simulating unchanged genomes, needs --schedule-seed")
+    parser.add_argument('--cache-path', nargs='?', default=None, const=CACHE_PATH,
+                        help=f"file the fitness cache is kept in between runs, {CACHE_PATH} when none is given")
+    parser.add_argument('--truncate-below', type=float, default=None,
+                        help="cut episodes short once their fitness can no longer reach this value")
+    parser.add_argument('--truncate-rank', type=int, default=None,
+                        help="cut episodes short once they can no longer beat the k-th best of the last generation")
+    parser.add_argument('--profile', default=None,
+                        help="file to write the time spent per simulation phase to, pstats for .prof, JSON otherwise")
+    parser.add_argument('--watch', type=float, default=None,
+                        help="show the first episode of every generation at this many frames per second")
+    parser.add_argument('--scenario', type=parse_scenario, action='append', default=None, dest='scenarios',
+                        help="layout:spawn_rate[:imbalance] every genome is scored in, may be repeated")
+    parser.add_argument('--seeds', type=int, default=1, help="schedules every scenario is played under")
+    parser.add_argument('--aggregate', choices=AGGREGATES, default='mean',
+                        help="fitness of a genome over its episodes")
+    args = parser.parse_args()
+
+    train(args.config, generations=args.generations, checkpoint_interval=args.checkpoint_interval,
+          checkpoint_prefix=args.checkpoint_prefix, resume=args.resume, genome_path=args.genome,
+          layout=args.layout, num_workers=args.workers, episode_time=args.episode_time,
+          batch_size=args.batch_size, vectorised=args.vectorised, decision_interval=args.decision_interval,
+          physics_ticks=args.physics_ticks, event_driven=args.event_driven, schedule_seed=args.schedule_seed,
+          cache_size=args.cache_size, cache_path=args.cache_path, truncate_below=args.truncate_below,
+          truncate_rank=args.truncate_rank, profile_path=args.profile, watch=args.watch,
+          scenarios=args.scenarios, num_seeds=args.seeds, aggregate=args.aggregate)